@@ -4,205 +4,4588 @@ import logging
 import sys
 import json
 import csv
+import importlib
+import os
+import signal
+import threading
+import queue
+import multiprocessing
+import hashlib
+import hmac
+import sqlite3
+import copy
+import io
+import locale
+import mmap
+import glob
+import time
+import gzip
+import bz2
+import lzma
+import shutil
+import tempfile
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from multiprocessing.util import Finalize
+from json.decoder import scanstring
+from json.encoder import encode_basestring_ascii
+from bisect import bisect_right
+from collections import Counter, OrderedDict, deque, namedtuple
+from itertools import cycle
 from faker import Faker
 import random
 
+try:
+    import ahocorasick  # optional C implementation of the keyword automaton
+except ImportError:
+    ahocorasick = None
+
+try:
+    import zstandard  # optional, for .zst input and output
+except ImportError:
+    zstandard = None
+
+try:  # Python 3.11+
+    from re import _parser as sre_parse
+    from re import _constants as sre_constants
+except ImportError:  # pragma: no cover - older interpreters
+    import sre_parse
+    import sre_constants
+
+__version__ = '0.2.0'
+
 # Configure logging
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 
-class DataPatternReplacer:
+# A pattern from the patterns file, compiled once and paired with its replacement.
+# ``repl`` is what is passed to ``sub``: the replacement template, or a callable
+# returning Faker data.
+CompiledPattern = namedtuple('CompiledPattern', ['name', 'regex', 'replacement', 'repl', 'requirement', 'prefilter'])
+
+ENGINES = ('sequential', 'combined')
+
+REGEX_BACKENDS = ('re', 'regex', 're2')
+
+# Target size of the byte ranges sanitized by each worker in parallel text mode.
+TEXT_CHUNK_SIZE = 4 << 20
+
+# Unchanged regions at least this long are written straight from the memory
+# map in --binary mode; shorter ones are coalesced with the replacements.
+MMAP_SLICE_MIN = 64 << 10
+
+# Compressed file formats, detected by magic bytes on input and by extension.
+COMPRESSION_EXTENSIONS = {'.gz': 'gzip', '.bz2': 'bz2', '.xz': 'xz', '.lzma': 'xz', '.zst': 'zstd', '.zstd': 'zstd'}
+COMPRESSION_MAGIC = ((b'\x1f\x8b', 'gzip'), (b'BZh', 'bz2'), (b'\xfd7zXZ\x00', 'xz'), (b'\x28\xb5\x2f\xfd', 'zstd'))
+
+# Size of the decompressed chunks read ahead by the decompression thread.
+DECOMPRESS_CHUNK_SIZE = 1 << 20
+
+# Size of the chunks scanned when aligning shard boundaries.
+SHARD_SCAN_SIZE = 1 << 20
+
+# Formats whose records are lines or rows and can be split into shards.
+SHARD_FORMATS = ('text', 'csv', 'jsonl')
+
+# File formats by extension, for --input_format auto.
+FORMAT_EXTENSIONS = {'.csv': 'csv', '.json': 'json', '.jsonl': 'jsonl', '.ndjson': 'jsonl', '.txt': 'text'}
+
+# An input_file containing these characters is a glob pattern for batch mode.
+_GLOB_MAGIC = re.compile(r'[*?[]')
+
+# Name of the manifest that --incremental keeps in the output root, and how
+# often (in files) it is saved during a batch.
+MANIFEST_NAME = '.datascan-manifest.json'
+MANIFEST_SAVE_INTERVAL = 1000
+
+# Command-line options that change the output; a change re-sanitizes every
+# file of an incremental batch.
+OUTPUT_OPTIONS = ('use_faker', 'faker_locale', 'faker_pool_reuse', 'deterministic_pseudonyms', 'input_format',
+                  'output_format', 'no_prefilter', 'engine', 'regex_backend', 'match_timeout', 'timeout_policy',
+                  'timeout_mask', 'encoding', 'binary', 'compact_json', 'stream_json', 'compression_level',
+                  'pseudonym_store', 'pseudonym_cache_size')
+
+# Number of pseudonym store rows kept in memory once read or written.
+PSEUDONYM_STORE_CACHE_SIZE = 100000
+
+# Lines or rows processed between checks whether a checkpoint is due.
+CHECKPOINT_CHECK_RECORDS = 1000
+
+# Number of rows per batch in parallel CSV mode.
+CSV_BATCH_ROWS = 1000
+
+TIMEOUT_POLICIES = ('fail', 'mask', 'skip')
+
+POOL_REUSE_POLICIES = ('none', 'cycle')
+POOL_REFILL_MODES = ('thread', 'process')
+
+# Flags that mean the same thing to every backend and to re's own parser.
+_PORTABLE_FLAGS = re.IGNORECASE | re.MULTILINE | re.DOTALL | re.VERBOSE
+
+# Constructs that depend on a pattern's own group numbering or on global flags
+# and therefore cannot be embedded in a larger alternation.
+_UNCOMBINABLE_RE = re.compile(r'\\[1-9]|\\g<\d|\(\?\(\d')
+
+_CATEGORY_FRAGMENTS = {
+    sre_constants.CATEGORY_DIGIT: r'\d',
+    sre_constants.CATEGORY_NOT_DIGIT: r'\D',
+    sre_constants.CATEGORY_SPACE: r'\s',
+    sre_constants.CATEGORY_NOT_SPACE: r'\S',
+    sre_constants.CATEGORY_WORD: r'\w',
+    sre_constants.CATEGORY_NOT_WORD: r'\W',
+}
+_REPEAT_OPS = (sre_constants.MAX_REPEAT, sre_constants.MIN_REPEAT, sre_constants.POSSESSIVE_REPEAT)
+
+# Character classes matching more than this many ASCII characters occur in
+# nearly every field and are useless as a prefilter.
+_MAX_PREFILTER_BREADTH = 32
+
+
+class _Unfilterable(Exception):
+    """Raised while analysing a pattern that cannot be prefiltered."""
+
+
+def _class_fragment(items):
+    """
+    Rebuilds a character class regex from the parsed items of an IN node.
+
+    Args:
+        items (list): The parsed (op, value) items of the class.
+
+    Returns:
+        str: The class as a regex fragment, or None if it uses unsupported items.
+    """
+    parts = []
+    for op, av in items:
+        if op is sre_constants.NEGATE:
+            parts.append('^')
+        elif op is sre_constants.LITERAL:
+            parts.append(re.escape(chr(av)))
+        elif op is sre_constants.RANGE:
+            parts.append(f"{re.escape(chr(av[0]))}-{re.escape(chr(av[1]))}")
+        elif op is sre_constants.CATEGORY and av in _CATEGORY_FRAGMENTS:
+            parts.append(_CATEGORY_FRAGMENTS[av])
+        else:
+            return None
+    return f"[{''.join(parts)}]"
+
+
+def _required_atoms(subpattern):
+    """
+    Collects literals and character classes that every match must contain.
+
+    Args:
+        subpattern (list): A parsed pattern or sub-pattern.
+
+    Returns:
+        list: (kind, value) tuples where kind is 'literal' or 'class'.
+
+    Raises:
+        _Unfilterable: If a case-insensitive group makes literals unreliable.
+    """
+    atoms = []
+    run = []
+    for op, av in subpattern:
+        if op is sre_constants.LITERAL:
+            run.append(chr(av))
+            continue
+        if run:
+            atoms.append(('literal', ''.join(run)))
+            run = []
+        if op is sre_constants.IN:
+            fragment = _class_fragment(av)
+            if fragment is not None:
+                atoms.append(('class', fragment))
+        elif op is sre_constants.SUBPATTERN:
+            add_flags = av[1]
+            if add_flags & re.IGNORECASE:
+                raise _Unfilterable()
+            atoms.extend(_required_atoms(av[-1]))
+        elif op in _REPEAT_OPS:
+            minimum, _, item = av
+            if minimum >= 1:
+                atoms.extend(_required_atoms(item))
+        elif op is sre_constants.ATOMIC_GROUP:
+            atoms.extend(_required_atoms(av))
+    if run:
+        atoms.append(('literal', ''.join(run)))
+    return atoms
+
+
+def _class_breadth(fragment):
+    """Returns how many ASCII characters a class fragment matches."""
+    regex = re.compile(fragment)
+    return sum(1 for code in range(128) if regex.match(chr(code)))
+
+
+def _select_prefilter(pattern, flags=0):
+    """
+    Chooses the cheapest necessary condition for a pattern to match.
+
+    The longest required literal is preferred (e.g. '@' for an email pattern);
+    otherwise the narrowest required character class is used (e.g. a digit for
+    card or phone numbers).  Case-insensitive patterns, including those with
+    an inline ``(?i)``, are not prefiltered.
+
+    Args:
+        pattern (str): The regex source.
+        flags (int): The flags the pattern was compiled with, if known.
+
+    Returns:
+        tuple: ('literal', text) or ('class', fragment) describing what must
+               occur in any matching input, or None if there is no usable
+               requirement.
+    """
+    try:
+        parsed = sre_parse.parse(pattern, flags & _PORTABLE_FLAGS)
+    except Exception:
+        return None
+    # Inline flags such as (?i) are only visible in the parse: pattern objects
+    # of some backends, such as re2, do not expose them.
+    state = getattr(parsed, 'state', None) or parsed.pattern
+    if (flags | state.flags) & re.IGNORECASE:
+        return None
+    try:
+        atoms = _required_atoms(parsed)
+    except Exception:
+        return None
+
+    # Whitespace is present in almost every field, so it is only a last resort.
+    literals = [value for kind, value in atoms if kind == 'literal' and not value.isspace()]
+    if literals:
+        return 'literal', max(literals, key=len)
+    classes = [(_class_breadth(value), value) for kind, value in atoms if kind == 'class']
+    classes = [item for item in classes if item[0] <= _MAX_PREFILTER_BREADTH]
+    if classes:
+        return 'class', min(classes)[1]
+    return None
+
+# A static estimate of how badly a regex can backtrack.
+PatternAnalysis = namedtuple('PatternAnalysis', ['complexity', 'issues', 'degree'])
+
+# Highest polynomial degree of backtracking that --strict_patterns accepts.
+STRICT_MAX_DEGREE = 4
+
+# Characters outside ASCII used when testing whether two character sets overlap.
+_ANALYSIS_SAMPLE = '\u00a0\u00e9\u00df\u0416\u0663\u20ac\u4e2d'
+_ANY_FRAGMENT = r'[\s\S]'
+
+
+class _BacktrackingAnalyzer:
+    """
+    Walks a parsed regex looking for shapes that backtrack super-linearly:
+
+    - nested quantifiers, where an unbounded inner repeat can also consume the
+      rest of its group and the start of the next iteration, e.g. ``(a+)+``,
+      ``(\\w+\\s?)+`` or ``([a-z]+.)+`` (exponential);
+    - alternations inside an unbounded repeat whose branches can start with the
+      same character, e.g. ``(\\d|\\w\\w?)+`` (exponential);
+    - chains of adjacent unbounded repeats over overlapping characters, e.g.
+      ``\\d+\\d+`` or ``.*,.*`` (polynomial, one degree per repeat), including
+      those formed by a bounded repeat of a group, e.g. ``(.*a){12}``.
+
+    Possessive repeats and atomic groups never backtrack and are ignored.
+    """
+
+    def __init__(self, pattern):
+        self.alphabet = set(map(chr, range(128))) | set(pattern) | set(_ANALYSIS_SAMPLE)
+        self.exponential = False
+        self.degree = 1
+        self.issues = []
+        self._matchers = {}
+
+    def _matches(self, fragments):
+        """Returns the sampled characters matched by any of the fragments."""
+        key = tuple(sorted(set(fragments)))
+        if key not in self._matchers:
+            if not key:
+                self._matchers[key] = frozenset()
+            else:
+                regex = re.compile('|'.join(key))
+                self._matchers[key] = frozenset(char for char in self.alphabet if regex.match(char))
+        return self._matchers[key]
+
+    def _overlap(self, first, second):
+        return bool(self._matches(first) & self._matches(second))
+
+    @staticmethod
+    def _is_unbounded(op, av):
+        return op in (sre_constants.MAX_REPEAT, sre_constants.MIN_REPEAT) and av[1] == sre_constants.MAXREPEAT
+
+    def _atom(self, op, av):
+        """Returns the fragment for a single-character op, or None."""
+        if op is sre_constants.LITERAL:
+            return re.escape(chr(av))
+        if op is sre_constants.NOT_LITERAL:
+            return f"[^{re.escape(chr(av))}]"
+        if op is sre_constants.IN:
+            return _class_fragment(av) or _ANY_FRAGMENT
+        if op is sre_constants.ANY:
+            return _ANY_FRAGMENT
+        return None
+
+    def _children(self, op, av):
+        """Returns the sub-sequences of a compound op."""
+        if op is sre_constants.SUBPATTERN:
+            return [av[-1]]
+        if op in _REPEAT_OPS:
+            return [av[2]]
+        if op is sre_constants.ATOMIC_GROUP or op in (sre_constants.ASSERT, sre_constants.ASSERT_NOT):
+            return [av if op is sre_constants.ATOMIC_GROUP else av[1]]
+        if op is sre_constants.BRANCH:
+            return list(av[1])
+        if op is sre_constants.GROUPREF_EXISTS:
+            return [item for item in av[1:] if item is not None]
+        return []
+
+    def first(self, items):
+        """
+        Returns (fragments, nullable): the characters a sequence can start with
+        and whether it can match the empty string.
+        """
+        fragments = []
+        for op, av in items:
+            item_fragments, nullable = self._first_item(op, av)
+            fragments.extend(item_fragments)
+            if not nullable:
+                return fragments, False
+        return fragments, True
+
+    def _first_item(self, op, av):
+        atom = self._atom(op, av)
+        if atom is not None:
+            return [atom], False
+        if op in _REPEAT_OPS:
+            fragments, nullable = self.first(av[2])
+            return fragments, nullable or av[0] == 0
+        if op in (sre_constants.SUBPATTERN, sre_constants.ATOMIC_GROUP):
+            return self.first(self._children(op, av)[0])
+        if op in (sre_constants.BRANCH, sre_constants.GROUPREF_EXISTS):
+            fragments, nullable = [], op is sre_constants.GROUPREF_EXISTS
+            for branch in self._children(op, av):
+                branch_fragments, branch_nullable = self.first(branch)
+                fragments.extend(branch_fragments)
+                nullable = nullable or branch_nullable
+            return fragments, nullable
+        if op is sre_constants.GROUPREF:
+            return [_ANY_FRAGMENT], True
+        # Anchors and lookarounds consume nothing.
+        return [], True
+
+    def chars(self, items):
+        """Returns fragments for every character a sequence can consume."""
+        fragments = []
+        for op, av in items:
+            atom = self._atom(op, av)
+            if atom is not None:
+                fragments.append(atom)
+            elif op is sre_constants.GROUPREF:
+                fragments.append(_ANY_FRAGMENT)
+            elif op not in (sre_constants.ASSERT, sre_constants.ASSERT_NOT):
+                for child in self._children(op, av):
+                    fragments.extend(self.chars(child))
+        return fragments
+
+    def _absorbing_repeats(self, items, following=()):
+        """
+        Yields the characters of inner unbounded repeats that could also consume
+        everything that follows them in the sequence.
+        """
+        for index, (op, av) in enumerate(items):
+            rest = list(items[index + 1:]) + list(following)
+            if self._is_unbounded(op, av):
+                chars = self.chars(av[2])
+                if all(self._first_item(*item)[1] or self._overlap(chars, self.chars([item])) for item in rest):
+                    yield chars
+            elif op is sre_constants.SUBPATTERN:
+                yield from self._absorbing_repeats(av[-1], rest)
+            elif op is sre_constants.BRANCH:
+                for branch in av[1]:
+                    yield from self._absorbing_repeats(branch, rest)
+
+    def _check_repeat(self, body):
+        """Looks for exponential shapes inside the body of an unbounded repeat."""
+        body_first, _ = self.first(body)
+        for chars in self._absorbing_repeats(body):
+            if self._overlap(chars, body_first):
+                self.exponential = True
+                self.issues.append('nested quantifiers over overlapping characters')
+                break
+        for op, av in body:
+            if op is sre_constants.SUBPATTERN and len(av[-1]) == 1:
+                op, av = av[-1][0]
+            if op is sre_constants.BRANCH:
+                firsts = [self.first(branch)[0] for branch in av[1]]
+                if any(self._overlap(firsts[i], firsts[j])
+                       for i in range(len(firsts)) for j in range(i + 1, len(firsts))):
+                    self.exponential = True
+                    self.issues.append('alternation with overlapping branches inside a repeat')
+            break
+
+    def _check_chain(self, items):
+        """Measures chains of adjacent unbounded repeats over overlapping characters."""
+        chain = 0
+        previous = None
+        for op, av in items:
+            if self._is_unbounded(op, av):
+                current = self.chars(av[2])
+                chain = chain + 1 if previous is not None and self._overlap(previous, current) else 1
+                previous = current
+                self.degree = max(self.degree, chain)
+            elif previous is not None and not self._first_item(op, av)[1]:
+                if not self._overlap(previous, self.chars([(op, av)])):
+                    chain, previous = 0, None
+
+    def _check_bounded_repeat(self, av):
+        """
+        Measures a bounded repeat whose copies form a chain: up to ``n`` copies
+        of an inner unbounded repeat that can absorb the rest of its group and
+        the start of the next copy.
+        """
+        count, body = av[1], av[2]
+        if count < 2 or count == sre_constants.MAXREPEAT:
+            return
+        body_first, _ = self.first(body)
+        for chars in self._absorbing_repeats(body):
+            if self._overlap(chars, body_first):
+                self.degree = max(self.degree, count)
+                break
+
+    def walk(self, items):
+        """Analyzes a sequence and all of its sub-sequences."""
+        self._check_chain(items)
+        for op, av in items:
+            if self._is_unbounded(op, av):
+                self._check_repeat(av[2])
+            elif op in (sre_constants.MAX_REPEAT, sre_constants.MIN_REPEAT):
+                self._check_bounded_repeat(av)
+            if op in (sre_constants.POSSESSIVE_REPEAT, sre_constants.ATOMIC_GROUP):
+                continue
+            for child in self._children(op, av):
+                self.walk(child)
+
+
+def analyze_pattern(pattern):
+    """
+    Statically estimates the worst-case backtracking of a regex.
+
+    The estimate is per match attempt and deliberately conservative: it flags
+    shapes known to cause catastrophic backtracking in a backtracking engine
+    such as ``re`` without proving that an attack string exists.
+
+    Args:
+        pattern (str): The regex source.
+
+    Returns:
+        PatternAnalysis: The estimated complexity ('O(n)', 'O(n^k)' or 'O(2^n)'),
+                         a list of the issues found and the polynomial degree k.
+    """
+    analyzer = _BacktrackingAnalyzer(pattern)
+    analyzer.walk(sre_parse.parse(pattern))
+    if analyzer.degree > 1:
+        analyzer.issues.append(f'{analyzer.degree} adjacent quantifiers over overlapping characters')
+    if analyzer.exponential:
+        complexity = 'O(2^n)'
+    elif analyzer.degree > 1:
+        complexity = f'O(n^{analyzer.degree})'
+    else:
+        complexity = 'O(n)'
+    return PatternAnalysis(complexity, list(dict.fromkeys(analyzer.issues)), analyzer.degree)
+
+
+PATTERN_TYPES = ('regex', 'dictionary')
+
+# Actions of the CSV column and JSON path rules besides a list of pattern names.
+RULE_ACTIONS = ('all', 'skip', 'mask')
+
+# Per-column CSV rules from the patterns file; see load_csv_column_rules.
+CsvColumnRules = namedtuple('CsvColumnRules', ['columns', 'default', 'mask'])
+
+
+class PatternTimeoutError(TimeoutError):
+    """Raised when a pattern exceeds the configured match timeout."""
+
+
+class _FieldMasked(Exception):
+    """Signals that a timed-out field has to be replaced by the timeout mask."""
+
+
+def _raise_pattern_timeout(signum, frame):
+    raise PatternTimeoutError()
+
+
+class MatchDeadline:
+    """
+    Context manager that interrupts regex matching after a number of seconds.
+
+    Uses a SIGALRM interval timer, which the ``re`` engine checks while
+    backtracking, so even a catastrophic pattern is stopped.  The timer is only
+    available on Unix, in the main thread; ``available`` reports whether the
+    deadline can be enforced in the current thread.
+    """
+
+    def __init__(self, seconds):
+        self.seconds = seconds
+
+    @property
+    def available(self):
+        return hasattr(signal, 'setitimer') and threading.current_thread() is threading.main_thread()
+
+    def __enter__(self):
+        if signal.getsignal(signal.SIGALRM) is not _raise_pattern_timeout:
+            signal.signal(signal.SIGALRM, _raise_pattern_timeout)
+        signal.setitimer(signal.ITIMER_REAL, self.seconds)
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        signal.setitimer(signal.ITIMER_REAL, 0)
+        return False
+
+
+class AhoCorasickAutomaton:
+    """
+    A pure-Python Aho-Corasick automaton used when pyahocorasick is not installed.
+
+    Mirrors the subset of the ``ahocorasick.Automaton`` interface used by
+    KeywordPattern: ``iter(text, start)`` yields ``(end_index, length)`` for
+    every term occurrence, in order of the index of its last character.
+    """
+
+    def __init__(self, terms):
+        """
+        Builds the trie, failure links and dictionary-suffix links.
+
+        Args:
+            terms (iterable): The non-empty terms to search for.
+        """
+        self._goto = [{}]
+        self._length = [0]
+        for term in terms:
+            state = 0
+            for char in term:
+                next_state = self._goto[state].get(char)
+                if next_state is None:
+                    next_state = len(self._goto)
+                    self._goto[state][char] = next_state
+                    self._goto.append({})
+                    self._length.append(0)
+                state = next_state
+            self._length[state] = len(term)
+
+        self._fail = [0] * len(self._goto)
+        self._output = [0] * len(self._goto)
+        queue = deque(self._goto[0].values())
+        while queue:
+            state = queue.popleft()
+            for char, next_state in self._goto[state].items():
+                queue.append(next_state)
+                fallback = self._fail[state]
+                while fallback and char not in self._goto[fallback]:
+                    fallback = self._fail[fallback]
+                target = self._goto[fallback].get(char, 0)
+                self._fail[next_state] = target if target != next_state else 0
+                link = self._fail[next_state]
+                self._output[next_state] = link if self._length[link] else self._output[link]
+
+    def iter(self, text, start=0):
+        """
+        Yields every term occurrence in ``text[start:]``.
+
+        Args:
+            text (str): The text to scan.
+            start (int): The index to start scanning from.
+
+        Yields:
+            tuple: (index of the last character, term length).
+        """
+        goto, fail, length, output = self._goto, self._fail, self._length, self._output
+        state = 0
+        for index in range(start, len(text)):
+            char = text[index]
+            while state and char not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(char, 0)
+            node = state if length[state] else output[state]
+            while node:
+                yield index, length[node]
+                node = output[node]
+
+
+class KeywordMatch:
+    """
+    A minimal match object for dictionary patterns, compatible with the parts
+    of ``re.Match`` used by replacement callables.
+    """
+
+    def __init__(self, string, start, end):
+        self.string = string
+        self._start = start
+        self._end = end
+
+    def start(self, group=0):
+        return self._start
+
+    def end(self, group=0):
+        return self._end
+
+    def span(self, group=0):
+        return self._start, self._end
+
+    def group(self, group=0):
+        return self.string[self._start:self._end]
+
+    def expand(self, template):
+        return template
+
+
+class KeywordPattern:
+    """
+    Matches a large list of literal terms in linear time with an Aho-Corasick
+    automaton, regardless of the number of terms.
+
+    The automaton is built once; matching is leftmost-longest and
+    non-overlapping, so "John Smith" wins over "John" at the same position.
+    Instances expose ``sub`` and ``finditer`` like a compiled regex so they can
+    be used wherever DataPatternReplacer uses one.
+    """
+
+    flags = 0
+    groups = 0
+    groupindex = {}
+
+    def __init__(self, terms, ignore_case=False, whole_words=True):
+        """
+        Initializes the KeywordPattern.
+
+        Args:
+            terms (iterable): The literal terms to replace.
+            ignore_case (bool): Whether matching ignores case.
+            whole_words (bool): Whether a term must not be surrounded by word characters.
+        """
+        self.ignore_case = ignore_case
+        self.whole_words = whole_words
+        terms = dict.fromkeys(self._normalize(term) for term in terms if term)
+        self.term_count = len(terms)
+        self.pattern = f"<dictionary of {self.term_count} terms>"
+        self._max_length = max((len(term) for term in terms), default=0)
+        if ahocorasick is not None:
+            self._automaton = ahocorasick.Automaton()
+            for term in terms:
+                self._automaton.add_word(term, len(term))
+            self._automaton.make_automaton()
+        else:
+            self._automaton = AhoCorasickAutomaton(terms)
+
+    def _normalize(self, text):
+        """
+        Lower-cases text for case-insensitive matching without changing its length.
+        """
+        if not self.ignore_case:
+            return text
+        lowered = text.lower()
+        if len(lowered) == len(text):
+            return lowered
+        return ''.join(char.lower() if len(char.lower()) == 1 else char for char in text)
+
+    def _is_boundary(self, text, start, end):
+        """
+        Returns True if text[start:end] is not embedded in a longer word.
+        """
+        if start > 0 and (text[start - 1].isalnum() or text[start - 1] == '_'):
+            return False
+        if end < len(text) and (text[end].isalnum() or text[end] == '_'):
+            return False
+        return True
+
+    def finditer(self, string):
+        """
+        Yields leftmost-longest, non-overlapping matches in ``string``.
+
+        Args:
+            string (str): The text to scan.
+
+        Yields:
+            KeywordMatch: The matches, in order.
+        """
+        if not self.term_count:
+            return
+        haystack = self._normalize(string)
+        position = 0
+        while position < len(haystack):
+            best = None
+            for index, length in self._automaton.iter(haystack, position):
+                end = index + 1
+                start = end - length
+                if best is not None and end - self._max_length > best[0]:
+                    # No later occurrence can start at or before the best one.
+                    break
+                if self.whole_words and not self._is_boundary(haystack, start, end):
+                    continue
+                if best is None or start < best[0] or (start == best[0] and end > best[1]):
+                    best = (start, end)
+            if best is None:
+                return
+            yield KeywordMatch(string, best[0], best[1])
+            position = best[1]
+
+    def sub(self, repl, string):
+        """
+        Replaces every match, like ``re.Pattern.sub``.
+
+        Args:
+            repl (str or callable): A literal replacement, or a callable taking a
+                                    KeywordMatch and returning the replacement.
+            string (str): The text to process.
+
+        Returns:
+            str: The text with all matches replaced.
+        """
+        parts = []
+        last = 0
+        for match in self.finditer(string):
+            parts.append(string[last:match.start()])
+            parts.append(repl(match) if callable(repl) else repl)
+            last = match.end()
+        if not parts:
+            return string
+        parts.append(string[last:])
+        return ''.join(parts)
+
+
+def _fill_faker_pools(faker_locale, provider_names, queues, batch_size, stop):
+    """
+    Keeps the per-provider queues of a FakerValuePool topped up with batches.
+
+    Runs in a background thread or process with its own, freshly seeded Faker
+    instance until ``stop`` is set.  The seed matters for forked processes,
+    which would otherwise replay the parent's random sequence.
+    """
+    faker = Faker(faker_locale)
+    faker.seed_instance(int.from_bytes(os.urandom(8), 'big'))
+    providers = [getattr(faker, name) for name in provider_names]
+    while not stop.is_set():
+        idle = True
+        for provider, batches in zip(providers, queues):
+            if batches.full():
+                continue
+            try:
+                batches.put([str(provider()) for _ in range(batch_size)], timeout=0.1)
+                idle = False
+            except queue.Full:
+                pass
+        if idle:
+            stop.wait(0.05)
+
+
+class FakerValuePool:
+    """
+    Serves Faker values from pools generated ahead of time.
+
+    With the 'none' reuse policy each value is served once and a background
+    thread or process refills the pools in batches while the main thread
+    matches; threads overlap generation with I/O, processes also run it on
+    other cores.  When a pool runs dry the value is generated on the spot and
+    counted as a miss.  With the 'cycle' policy ``size`` values are generated
+    once per provider and then served round-robin, which makes Faker
+    replacements as cheap as static ones at the cost of repeating values.
+    """
+
+    def __init__(self, faker, faker_locale, size, reuse='none', refill='thread', workers=1, stats=None):
+        """
+        Initializes the FakerValuePool.
+
+        Args:
+            faker (Faker): The Faker instance used for 'cycle' pools and for misses.
+            faker_locale (str): The locale of the background Faker instance.
+            size (int): The number of values kept per provider.
+            reuse (str): 'none' to serve every value once, 'cycle' to reuse a fixed pool.
+            refill (str): 'thread' or 'process', where 'none' pools are refilled.
+            workers (int): The number of background refill threads or processes.
+            stats (Counter): Counter receiving 'faker_pool_misses'.
+        """
+        if reuse not in POOL_REUSE_POLICIES:
+            raise ValueError(f"Unknown pool reuse policy '{reuse}'. Expected one of: {', '.join(POOL_REUSE_POLICIES)}")
+        if refill not in POOL_REFILL_MODES:
+            raise ValueError(f"Unknown pool refill mode '{refill}'. Expected one of: {', '.join(POOL_REFILL_MODES)}")
+        self.faker = faker
+        self.faker_locale = faker_locale
+        self.size = size
+        self.reuse = reuse
+        self.refill = refill
+        self.workers = max(1, workers)
+        self.stats = stats if stats is not None else Counter()
+        self.batch_size = max(1, min(1000, size // 4))
+        self._queues = {}
+        self._stop = None
+        self._workers = []
+
+    def provider(self, name):
+        """
+        Returns a callable serving values of a Faker provider from the pool.
+
+        Args:
+            name (str): The Faker provider name.
+
+        Returns:
+            callable: A function taking no arguments and returning a string.
+        """
+        fallback = getattr(self.faker, name)
+        if self.reuse == 'cycle':
+            return cycle([str(fallback()) for _ in range(self.size)]).__next__
+
+        if name not in self._queues:
+            depth = max(2, self.size // self.batch_size)
+            self._queues[name] = multiprocessing.Queue(depth) if self.refill == 'process' else queue.Queue(depth)
+        batches = self._queues[name]
+        buffer = deque()
+        stats = self.stats
+
+        def next_value():
+            if not buffer:
+                try:
+                    buffer.extend(batches.get_nowait())
+                except queue.Empty:
+                    stats['faker_pool_misses'] += 1
+                    return str(fallback())
+            return buffer.popleft()
+
+        return next_value
+
+    def start(self):
+        """
+        Starts the background refill once all providers have been registered.
+        """
+        if not self._queues or self._workers:
+            return
+        names = list(self._queues)
+        if self.refill == 'process':
+            self._stop = multiprocessing.Event()
+            worker_type = multiprocessing.Process
+        else:
+            self._stop = threading.Event()
+            worker_type = threading.Thread
+        for _ in range(self.workers):
+            worker = worker_type(target=_fill_faker_pools, daemon=True,
+                                 args=(self.faker_locale, names, [self._queues[name] for name in names],
+                                       self.batch_size, self._stop))
+            worker.start()
+            self._workers.append(worker)
+
+    def close(self):
+        """
+        Stops the background refill.
+        """
+        if not self._workers:
+            return
+        self._stop.set()
+        if self.refill == 'process':
+            for batches in self._queues.values():
+                batches.cancel_join_thread()
+        for worker in self._workers:
+            worker.join(timeout=1)
+            if self.refill == 'process' and worker.is_alive():
+                worker.terminate()
+        self._workers = []
+
+
+class PseudonymCache:
+    """
+    A bounded LRU mapping from original values to the fake values that replaced them.
+
+    Identical originals get the same pseudonym for as long as they stay in the
+    cache, which keeps references consistent across rows and documents and
+    skips generating a new value for every repeat.  Hits, misses and evictions
+    are counted in ``stats``.
+    """
+
+    def __init__(self, maxsize, stats=None):
+        """
+        Initializes the PseudonymCache.
+
+        Args:
+            maxsize (int): The maximum number of entries kept.
+            stats (Counter): Counter receiving 'pseudonym_cache_hits', '_misses' and '_evictions'.
+        """
+        self.maxsize = maxsize
+        self.stats = stats if stats is not None else Counter()
+        self._entries = OrderedDict()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get(self, key):
+        """
+        Returns the cached pseudonym for ``key`` and marks it recently used, or None.
+        """
+        value = self._entries.get(key)
+        if value is None:
+            self.stats['pseudonym_cache_misses'] += 1
+        else:
+            self.stats['pseudonym_cache_hits'] += 1
+            self._entries.move_to_end(key)
+        return value
+
+    def put(self, key, value):
+        """
+        Stores a pseudonym, evicting the least recently used entry when full.
+        """
+        self._entries[key] = value
+        if len(self._entries) > self.maxsize:
+            self._entries.popitem(last=False)
+            self.stats['pseudonym_cache_evictions'] += 1
+
+    def items(self):
+        """
+        Returns the (key, pseudonym) pairs, least recently used first.
+        """
+        return list(self._entries.items())
+
+    def load(self, items):
+        """
+        Replaces the contents with (key, pseudonym) pairs, least recently used first.
+        """
+        self._entries = OrderedDict(items)
+        while len(self._entries) > self.maxsize:
+            self._entries.popitem(last=False)
+
+
+class PseudonymStore:
+    """
+    A persistent pseudonym mapping in a local SQLite file, shared across runs.
+
+    Originals are never written to disk: rows are keyed by an HMAC of the
+    provider name and the original (a plain SHA-256 when no pseudonym key is
+    set).  The database runs in WAL mode.  New mappings are buffered and
+    inserted in batches, one transaction per batch, and lookups check the
+    buffer before the table.  Committed rows are kept in a bounded LRU cache,
+    so repeated originals do not cost a query each.  When several processes
+    share a store, the first committed value for an original wins; in shared
+    mode every new mapping is committed at once and read back, so all
+    processes use that value.
+    """
+
+    def __init__(self, path, key=None, batch_size=1000, stats=None, shared=False,
+                 cache_size=PSEUDONYM_STORE_CACHE_SIZE):
+        """
+        Initializes the PseudonymStore, creating the database if needed.
+
+        Args:
+            path (str): Path to the SQLite file.
+            key (bytes): Secret used to key the row digests.
+            batch_size (int): Number of new mappings buffered before they are
+                              written, or None to buffer them until flush().
+            stats (Counter): Counter receiving 'pseudonym_store_hits' and '_misses'.
+            shared (bool): Whether other processes use the store at the same time.
+            cache_size (int): Number of committed rows kept in memory.
+        """
+        self.path = path
+        self.key = key
+        self.batch_size = batch_size
+        self.shared = shared
+        self.stats = stats if stats is not None else Counter()
+        self._pending = {}
+        # Only committed rows, keyed by (provider, original): discarding the
+        # pending mappings must not leave them behind here.
+        self._cache = PseudonymCache(cache_size)
+        self._connection = sqlite3.connect(path, timeout=30)
+        self._connection.execute('PRAGMA journal_mode=WAL')
+        self._connection.execute('PRAGMA synchronous=NORMAL')
+        self._connection.execute('CREATE TABLE IF NOT EXISTS pseudonyms '
+                                 '(digest BLOB PRIMARY KEY, value TEXT NOT NULL) WITHOUT ROWID')
+        self._connection.commit()
+        if not key:
+            logging.warning("Pseudonym store keys are unkeyed hashes; set a pseudonym key to protect "
+                            "low-entropy originals such as phone numbers.")
+
+    def _digest(self, provider_name, original):
+        message = provider_name.encode('utf-8') + b'\x00' + original.encode('utf-8')
+        if self.key:
+            return hmac.new(self.key, message, hashlib.sha256).digest()
+        return hashlib.sha256(message).digest()
+
+    def get(self, provider_name, original):
+        """
+        Returns the stored pseudonym for an original, or None.
+        """
+        key = (provider_name, original)
+        value = self._cache.get(key)
+        if value is None:
+            digest = self._digest(provider_name, original)
+            value = self._pending.get(digest)
+            if value is None:
+                row = self._connection.execute('SELECT value FROM pseudonyms WHERE digest = ?',
+                                               (digest,)).fetchone()
+                if row:
+                    value = row[0]
+                    self._cache.put(key, value)
+        self.stats['pseudonym_store_hits' if value is not None else 'pseudonym_store_misses'] += 1
+        return value
+
+    def put(self, provider_name, original, value):
+        """
+        Records a new mapping and returns the pseudonym to use for the original.
+
+        The mapping is buffered and the buffer written once it reaches
+        ``batch_size``.  In shared mode it is committed at once instead, and
+        the value another process committed first, if any, is returned.
+        """
+        digest = self._digest(provider_name, original)
+        if self.shared:
+            with self._connection:
+                self._connection.execute('INSERT OR IGNORE INTO pseudonyms (digest, value) VALUES (?, ?)',
+                                         (digest, value))
+            value = self._connection.execute('SELECT value FROM pseudonyms WHERE digest = ?', (digest,)).fetchone()[0]
+            self._cache.put((provider_name, original), value)
+            return value
+        self._pending[digest] = value
+        if self.batch_size is not None and len(self._pending) >= self.batch_size:
+            self.flush()
+        return value
+
+    def flush(self):
+        """
+        Writes buffered mappings in a single transaction.
+        """
+        if not self._pending:
+            return
+        with self._connection:
+            self._connection.executemany('INSERT OR IGNORE INTO pseudonyms (digest, value) VALUES (?, ?)',
+                                         self._pending.items())
+        self._pending.clear()
+
+    def discard(self):
+        """
+        Drops buffered mappings without writing them.
+        """
+        self._pending.clear()
+
+    def pending(self):
+        """
+        Returns the buffered mappings as JSON-serializable (digest, value) pairs.
+        """
+        return [[digest.hex(), value] for digest, value in self._pending.items()]
+
+    def write(self, mappings):
+        """
+        Writes mappings returned by pending() in a single transaction.
+        """
+        with self._connection:
+            self._connection.executemany('INSERT OR IGNORE INTO pseudonyms (digest, value) VALUES (?, ?)',
+                                         ((bytes.fromhex(digest), value) for digest, value in mappings))
+
+    def close(self):
+        """
+        Flushes buffered mappings and closes the database.
+        """
+        if self._connection is None:
+            return
+        self.flush()
+        self._connection.close()
+        self._connection = None
+
+
+def compact_pseudonym_store(path):
+    """
+    Checkpoints the WAL into a pseudonym store and rebuilds the database file.
+
+    Args:
+        path (str): Path to the SQLite file.
+    """
+    if not os.path.exists(path):
+        raise FileNotFoundError(f"Pseudonym store not found: {path}")
+    size_before = os.path.getsize(path)
+    connection = sqlite3.connect(path)
+    try:
+        connection.execute('PRAGMA wal_checkpoint(TRUNCATE)')
+        connection.execute('VACUUM')
+        rows = connection.execute('SELECT COUNT(*) FROM pseudonyms').fetchone()[0]
+    finally:
+        connection.close()
+    logging.info(f"Compacted pseudonym store {path}: {rows} entries, "
+                 f"{size_before} -> {os.path.getsize(path)} bytes.")
+
+
+def load_regex_backend(name):
+    """
+    Imports the module used to compile regex patterns.
+
+    Args:
+        name (str): One of REGEX_BACKENDS.  're2' refers to the google-re2
+                    bindings, which guarantee linear-time matching.
+
+    Returns:
+        module: The backend module, or ``re`` if the requested one is not installed.
+    """
+    if name not in REGEX_BACKENDS:
+        raise ValueError(f"Unknown regex backend '{name}'. Expected one of: {', '.join(REGEX_BACKENDS)}")
+    if name == 're':
+        return re
+    try:
+        return importlib.import_module(name)
+    except ImportError:
+        logging.warning(f"Regex backend '{name}' is not installed. Falling back to 're'.")
+        return re
+
+
+def _load_dictionary_terms(spec):
+    """
+    Returns the terms of a dictionary pattern from its inline list and/or term file.
+
+    Args:
+        spec (dict): The pattern definition from the patterns file.
+
+    Returns:
+        list: The terms.
+    """
+    terms = list(spec.get('terms', []))
+    terms_file = spec.get('terms_file')
+    if terms_file:
+        with open(terms_file, 'r', encoding='utf-8') as f:
+            terms.extend(line.strip() for line in f if line.strip())
+    return terms
+
+
+_SELECTOR_STEP = re.compile(r'\.(\*\*|\*|[^.\[\]]+)|\[(\*|\d+)\]')
+_ANY_STEP = object()
+_ANY_DEPTH = object()
+
+
+def _parse_json_selector(selector):
+    """
+    Parses a key-path selector into a tuple of steps.
+
+    Selectors start at ``$`` (which may be omitted) and continue with ``.key``,
+    ``[n]`` array indices, ``*`` or ``[*]`` for any single key or index, and
+    ``**`` for any number of levels, e.g. ``$.users[*].email`` or ``**.phone``.
+
+    Raises:
+        ValueError: If the selector cannot be parsed.
+    """
+    text = selector[1:] if selector.startswith('$') else selector
+    if text and text[0] not in '.[':
+        text = '.' + text
+    steps = []
+    position = 0
+    while position < len(text):
+        match = _SELECTOR_STEP.match(text, position)
+        if match is None:
+            raise ValueError(f"{selector}: cannot parse selector at '{text[position:]}'")
+        key, index = match.groups()
+        if key == '**':
+            steps.append(_ANY_DEPTH)
+        elif key == '*' or index == '*':
+            steps.append(_ANY_STEP)
+        else:
+            steps.append(key if key is not None else int(index))
+        position = match.end()
+    return tuple(steps)
+
+
+class JsonPathRules:
+    """
+    Key-path rules for JSON documents.
+
+    The selectors are run together as a small NFA while the document is
+    traversed.  A traversal state is a frozenset of (selector, position) pairs
+    plus the action in force; the action of the deepest selector matching a
+    value or one of its ancestors wins, ties going to the selector declared
+    first.  A subtree under "skip" that no selector can reach any more is
+    pruned without being traversed, and a value under "mask" is replaced as a
+    whole.
+    """
+
+    def __init__(self, selectors, default='all', mask='[REDACTED]'):
+        """
+        Initializes the JsonPathRules.
+
+        Args:
+            selectors (dict): Maps selectors to a list of pattern names or to
+                              one of RULE_ACTIONS.
+            default (str or list): The action outside every selector.
+            mask (str): The replacement for masked values.
+        """
+        self.selectors = [_parse_json_selector(selector) for selector in selectors]
+        self.actions = [action if isinstance(action, str) else frozenset(action) for action in selectors.values()]
+        self.default = default if isinstance(default, str) else frozenset(default)
+        self.mask = mask
+        self._steps = {}
+
+    def _closure(self, positions):
+        """
+        Adds the positions reachable by letting ``**`` match zero levels.
+        """
+        positions = set(positions)
+        pending = list(positions)
+        while pending:
+            selector, position = pending.pop()
+            steps = self.selectors[selector]
+            if position < len(steps) and steps[position] is _ANY_DEPTH and (selector, position + 1) not in positions:
+                positions.add((selector, position + 1))
+                pending.append((selector, position + 1))
+        return frozenset(positions)
+
+    def _state(self, positions, action):
+        matched = [selector for selector, position in positions if position == len(self.selectors[selector])]
+        if matched:
+            action = self.actions[min(matched)]
+        return positions, action
+
+    def root(self):
+        """
+        Returns the traversal state of the document root.
+        """
+        return self._state(self._closure((selector, 0) for selector in range(len(self.selectors))), self.default)
+
+    def step(self, state, key):
+        """
+        Returns the traversal state of the member ``key`` (an object key or an
+        array index) of the value in ``state``.
+        """
+        memo = (state, key)
+        cached = self._steps.get(memo)
+        if cached is not None:
+            return cached
+        positions, action = state
+        following = set()
+        for selector, position in positions:
+            steps = self.selectors[selector]
+            if position == len(steps):
+                continue
+            expected = steps[position]
+            if expected is _ANY_DEPTH:
+                following.add((selector, position))
+            elif expected is _ANY_STEP or (type(expected) is type(key) and expected == key):
+                following.add((selector, position + 1))
+        result = self._state(self._closure(following), action)
+        if len(self._steps) < 65536:
+            self._steps[memo] = result
+        return result
+
+    def prunable(self, state):
+        """
+        Returns True if nothing in the subtree of ``state`` is sanitized.
+        """
+        positions, action = state
+        return action == 'skip' and all(position == len(self.selectors[selector])
+                                        for selector, position in positions)
+
+
+class DataPatternReplacer:
+    """
+    Identifies and replaces sensitive data patterns using regular expressions.
+    Supports configurable replacement strings and Faker for realistic anonymization.
+
+    Two matching engines are available:
+
+    - ``sequential`` (default) applies each pattern in turn to the output of the
+      previous one.  A later pattern can therefore match text produced by an
+      earlier replacement, and rule order decides which of two overlapping
+      patterns wins.
+    - ``combined`` merges all patterns into a single alternation and scans the
+      input once.  At each position the leftmost match wins; when several
+      patterns match at the same position, the one defined first in the
+      patterns file wins.  Replacement text is never rescanned.  Patterns that
+      rely on their own group numbering (numeric backreferences) or on global
+      inline flags cannot join the alternation and run as separate passes
+      afterwards, in definition order, as do dictionary patterns.
+
+    Before any pattern runs, a prefilter checks the input for the literals or
+    character classes each pattern requires (e.g. '@' for an email pattern).
+    Inputs that contain none of them are returned unchanged without running a
+    single regex.  Counters are kept in ``stats``.
+
+    Regex patterns are compiled with a selectable backend: ``re``, the
+    third-party ``regex`` module, or ``re2`` whose linear-time matching cannot
+    backtrack catastrophically.  A pattern the backend rejects (for example a
+    backreference or lookaround under re2) falls back to ``re`` on its own.
+    """
+
+    def __init__(self, patterns=None, replacements=None, use_faker=False, faker_locale='en_US', engine='sequential',
+                 prefilter=True, regex_backend='re', match_timeout=None, timeout_policy='fail',
+                 timeout_mask='[REDACTED]', faker_pool_size=0, faker_pool_reuse='none',
+                 faker_pool_refill='thread', faker_pool_workers=1, pseudonym_cache_size=0,
+                 deterministic=False, pseudonym_key=None, pseudonym_store=None, pseudonym_store_shared=False):
+        """
+        Initializes the DataPatternReplacer.
+
+        Args:
+            patterns (dict): A dictionary of regular expression patterns to identify sensitive data.
+                             Keys are pattern names (e.g., "credit_card") and values are the regex strings,
+                             or dictionary pattern definitions such as
+                             {"type": "dictionary", "terms": [...], "terms_file": "...",
+                              "ignore_case": false, "whole_words": true}.
+            replacements (dict): A dictionary of replacement strings for each pattern.
+                               Keys correspond to the pattern names in the 'patterns' dictionary,
+                               and values are the replacement strings.  If use_faker is True, this can
+                               contain Faker provider names.
+            use_faker (bool): Whether to use Faker to generate realistic replacement data.
+            faker_locale (str): The locale to use for Faker.
+            engine (str): The matching engine, either 'sequential' or 'combined'.
+            prefilter (bool): Whether to skip inputs that cannot match any pattern.
+            regex_backend (str): The module used to compile regex patterns, one of
+                                 're', 'regex' or 're2'.
+            match_timeout (float): Maximum seconds per pattern per input, or None for no limit.
+            timeout_policy (str): What to do when the timeout expires: 'fail', 'mask' or 'skip'.
+            timeout_mask (str): The value that replaces a field under the 'mask' policy.
+            faker_pool_size (int): Number of pre-generated values per Faker provider, or 0
+                                   to call Faker for every match.
+            faker_pool_reuse (str): 'none' to serve each pooled value once, 'cycle' to reuse them.
+            faker_pool_refill (str): Whether pools are refilled by 'thread's or 'process'es.
+            faker_pool_workers (int): The number of background refill threads or processes.
+            pseudonym_cache_size (int): Maximum number of original values remembered so that
+                                        repeats get the same fake value, or 0 to disable.
+            deterministic (bool): Whether Faker replacements are derived from a keyed hash of
+                                  the original by default.  Replacement objects in the patterns
+                                  file can override this per pattern.
+            pseudonym_key (str or bytes): The secret key for deterministic pseudonyms.
+            pseudonym_store (str): Path to a SQLite file persisting pseudonyms across runs.
+            pseudonym_store_shared (bool): Whether other processes use the store at the
+                                           same time, so that new mappings are committed at once.
+        """
+        if engine not in ENGINES:
+            raise ValueError(f"Unknown engine '{engine}'. Expected one of: {', '.join(ENGINES)}")
+        if timeout_policy not in TIMEOUT_POLICIES:
+            raise ValueError(f"Unknown timeout policy '{timeout_policy}'. "
+                             f"Expected one of: {', '.join(TIMEOUT_POLICIES)}")
+        self.patterns = patterns or {}
+        self.replacements = replacements or {}
+        self.use_faker = use_faker
+        self.faker = Faker(faker_locale) if use_faker else None
+        self.faker_locale = faker_locale
+        self.deterministic = deterministic
+        self.pseudonym_key = pseudonym_key.encode('utf-8') if isinstance(pseudonym_key, str) else pseudonym_key
+        self._keyed_faker = None
+        self.engine = engine
+        self.regex_backend = load_regex_backend(regex_backend)
+        self.use_prefilter = prefilter
+        self.timeout_policy = timeout_policy
+        self.timeout_mask = timeout_mask
+        self._deadline = MatchDeadline(match_timeout) if match_timeout else None
+        if self._deadline is not None and not hasattr(signal, 'setitimer'):
+            logging.warning("Match timeouts require SIGALRM and are not enforced on this platform.")
+            self._deadline = None
+        self.stats = Counter()
+        self._faker_pool = None
+        if use_faker and faker_pool_size > 0:
+            self._faker_pool = FakerValuePool(self.faker, faker_locale, faker_pool_size, faker_pool_reuse,
+                                              faker_pool_refill, faker_pool_workers, self.stats)
+        self._store = None
+        if use_faker and pseudonym_store:
+            self._store = PseudonymStore(pseudonym_store, self.pseudonym_key, stats=self.stats,
+                                         shared=pseudonym_store_shared)
+        self._pseudonyms = None
+        if use_faker and pseudonym_cache_size > 0:
+            self._pseudonyms = PseudonymCache(pseudonym_cache_size, self.stats)
+        self._restricted = {}
+        self.compiled_patterns = self._compile_patterns()
+        if self._faker_pool is not None:
+            self._faker_pool.start()
+        self._build_combined()
+        self._build_prefilter()
+
+    def _compile_patterns(self):
+        """
+        Validates and compiles every pattern once, in definition order.
+
+        Patterns without a replacement are dropped with a single warning.  All
+        invalid regular expressions and unknown Faker providers are reported
+        together so that a broken patterns file fails before any data is
+        processed.
+
+        Returns:
+            tuple: A tuple of CompiledPattern entries.
+
+        Raises:
+            ValueError: If one or more patterns are invalid.
+        """
+        compiled = []
+        errors = []
+        for pattern_name, pattern in self.patterns.items():
+            replacement = self.replacements.get(pattern_name)
+            if replacement is None:
+                logging.warning(f"No replacement found for pattern: {pattern_name}. Skipping.")
+                continue
+            try:
+                regex = self._compile_pattern(pattern_name, pattern)
+                repl = self._build_repl(pattern_name, replacement)
+            except (re.error, ValueError, OSError) as e:
+                errors.append(f"{pattern_name}: {e}")
+                continue
+            compiled.append(CompiledPattern(pattern_name, regex, replacement, repl, *self._pattern_prefilter(regex)))
+
+        if errors:
+            for error in errors:
+                logging.error(f"Invalid pattern {error}")
+            raise ValueError(f"Invalid pattern(s) in patterns file: {'; '.join(errors)}")
+
+        return tuple(compiled)
+
+    def _build_repl(self, pattern_name, replacement):
+        """
+        Resolves a replacement into the value passed to ``sub``.
+
+        With Faker enabled, a replacement naming a Faker provider is resolved to
+        the provider's bound method once, so each match costs a direct call.  A
+        replacement that looks like a provider name (a lower-case identifier)
+        but is not one is an error; any other replacement is used as a literal
+        template.  A replacement may also be an object such as
+        {"provider": "email", "deterministic": true} to choose the pseudonym
+        mode per pattern.
+
+        Args:
+            pattern_name (str): The pattern name, used in messages.
+            replacement (str or dict): The replacement from the patterns file.
+
+        Returns:
+            str or callable: The replacement template or a callable taking a match.
+
+        Raises:
+            ValueError: If the replacement names an unknown Faker provider.
+        """
+        deterministic = self.deterministic
+        if isinstance(replacement, dict):
+            if not self.use_faker:
+                raise ValueError("provider replacements require Faker to be enabled")
+            deterministic = replacement.get('deterministic', deterministic)
+            replacement = replacement.get('provider')
+            if not isinstance(replacement, str) or not callable(getattr(self.faker, replacement, None)):
+                raise ValueError(f"unknown Faker provider '{replacement}'")
+        elif not isinstance(replacement, str):
+            raise ValueError(f"expected a string or an object replacement, got {type(replacement).__name__}")
+        if not self.use_faker:
+            return replacement
+
+        provider = getattr(self.faker, replacement, None)
+        if callable(provider):
+            if deterministic:
+                generate = self._keyed(replacement)
+            elif self._faker_pool is not None:
+                pooled = self._faker_pool.provider(replacement)
+                generate = lambda match: pooled()
+            else:
+                generate = lambda match: str(provider())
+            if self._store is not None:
+                generate = self._stored(replacement, generate)
+            if self._pseudonyms is not None:
+                generate = self._consistent(replacement, generate)
+            return generate
+        if replacement.isidentifier() and replacement.islower():
+            raise ValueError(f"unknown Faker provider '{replacement}'")
+        logging.info(f"Replacement for pattern '{pattern_name}' is not a Faker provider; using it as a literal.")
+        return replacement
+
+    def _keyed(self, provider_name):
+        """
+        Returns a generator deriving each fake value from an HMAC of the original.
+
+        The HMAC-SHA256 of the provider name and the matched text, keyed with the
+        pseudonym key, seeds a dedicated Faker instance before the provider is
+        called.  The same original therefore always yields the same pseudonym,
+        in every process and every run, without storing any mapping.  Values
+        are stable for a given Faker version and locale.
+
+        Args:
+            provider_name (str): The Faker provider to call.
+
+        Returns:
+            callable: The replacement callable taking a match.
+
+        Raises:
+            ValueError: If no pseudonym key is configured.
+        """
+        if not self.pseudonym_key:
+            raise ValueError("deterministic pseudonyms require a pseudonym key")
+        if self._keyed_faker is None:
+            self._keyed_faker = Faker(self.faker_locale)
+        faker = self._keyed_faker
+        provider = getattr(faker, provider_name)
+        key = self.pseudonym_key
+        prefix = provider_name.encode('utf-8') + b'\x00'
+
+        def generate(match):
+            digest = hmac.new(key, prefix + match.group(0).encode('utf-8'), hashlib.sha256).digest()
+            faker.seed_instance(int.from_bytes(digest[:16], 'big'))
+            return str(provider())
+
+        return generate
+
+    def _stored(self, provider_name, generate):
+        """
+        Wraps a Faker replacement so that pseudonyms are read from and written
+        to the persistent store.
+
+        Args:
+            provider_name (str): The Faker provider, part of the store key.
+            generate (callable): Produces a new fake value for a match.
+
+        Returns:
+            callable: The replacement callable taking a match.
+        """
+        store = self._store
+
+        def replace(match):
+            original = match.group(0)
+            value = store.get(provider_name, original)
+            if value is None:
+                value = store.put(provider_name, original, generate(match))
+            return value
+
+        return replace
+
+    def _consistent(self, provider_name, generate):
+        """
+        Wraps a Faker replacement so that repeated originals reuse their pseudonym.
+
+        Args:
+            provider_name (str): The Faker provider, part of the cache key.
+            generate (callable): Produces a new fake value for a match.
+
+        Returns:
+            callable: The replacement callable taking a match.
+        """
+        cache = self._pseudonyms
+
+        def replace(match):
+            key = (provider_name, match.group(0))
+            value = cache.get(key)
+            if value is None:
+                value = generate(match)
+                cache.put(key, value)
+            return value
+
+        return replace
+
+    def _compile_pattern(self, pattern_name, pattern):
+        """
+        Compiles a single pattern definition.
+
+        Args:
+            pattern_name (str): The name of the pattern, used in messages.
+            pattern (str or dict): A regex string, or a dict with a "type" key.
+
+        Returns:
+            object: The compiled regex of the selected backend, or a KeywordPattern.
+        """
+        if isinstance(pattern, str):
+            backend = self.regex_backend
+            if backend is not re:
+                try:
+                    return backend.compile(pattern)
+                except Exception as e:
+                    logging.warning(f"Pattern '{pattern_name}' is not supported by the '{backend.__name__}' "
+                                    f"backend ({e}). Using 're' for this pattern.")
+            return re.compile(pattern)
+        if not isinstance(pattern, dict):
+            raise ValueError(f"expected a string or an object, got {type(pattern).__name__}")
+
+        pattern_type = pattern.get('type', 'regex')
+        if pattern_type == 'regex':
+            return self._compile_pattern(pattern_name, pattern.get('pattern'))
+        if pattern_type == 'dictionary':
+            terms = _load_dictionary_terms(pattern)
+            return KeywordPattern(terms, pattern.get('ignore_case', False), pattern.get('whole_words', True))
+        raise ValueError(f"unknown pattern type '{pattern_type}'. Expected one of: {', '.join(PATTERN_TYPES)}")
+
+    def _pattern_prefilter(self, regex):
+        """
+        Works out what an input must contain before ``regex`` can match.
+
+        Returns:
+            tuple: The requirement as a regex fragment and a cheap test for it,
+                   or (None, None) if the pattern cannot be prefiltered.
+        """
+        if not self.use_prefilter or isinstance(regex, KeywordPattern):
+            return None, None
+        requirement = _select_prefilter(regex.pattern, getattr(regex, 'flags', 0))
+        if requirement is None:
+            return None, None
+        kind, value = requirement
+        if kind == 'literal':
+            return re.escape(value), lambda data: value in data
+        return value, re.compile(value).search
+
+    def _build_prefilter(self):
+        """
+        Builds the single scan that rejects inputs no pattern can match.
+
+        The scan is only possible when every pattern has a requirement; a single
+        unfilterable pattern means every input has to be examined.
+        """
+        self._prefilter = None
+        if not self.use_prefilter or not self.compiled_patterns:
+            return
+        for entry in self.compiled_patterns:
+            if entry.requirement is None:
+                logging.info(f"Pattern '{entry.name}' has no literal requirement; prefilter disabled.")
+                return
+        fragments = dict.fromkeys(entry.requirement for entry in self.compiled_patterns)
+        self._prefilter = re.compile('|'.join(fragments)).search
+
+    def checkpoint(self):
+        """
+        Captures the state needed to resume processing with identical output.
+
+        The state holds the stats, the pseudonym cache contents (original
+        values included), the pending pseudonym store writes and the Faker
+        random state; values served from a Faker pool cannot be replayed.
+        The store writes are not made here: call commit_store_writes() once
+        the state has been saved, so that the store never holds mappings the
+        saved state does not know about.
+
+        Returns:
+            dict: A JSON-serializable state for restore().
+        """
+        state = {'stats': dict(self.stats), 'pseudonyms': None, 'store_pending': None, 'faker_random': None}
+        if self._pseudonyms is not None:
+            state['pseudonyms'] = [[list(key), value] for key, value in self._pseudonyms.items()]
+        if self._store is not None:
+            state['store_pending'] = self._store.pending()
+        if self.faker is not None:
+            version, internal, gauss = self.faker.random.getstate()
+            state['faker_random'] = [version, list(internal), gauss]
+        return state
+
+    def hold_store_writes(self):
+        """
+        Keeps new pseudonym store mappings buffered until the next checkpoint().
+
+        A resumed run must find the store as it was at the checkpoint;
+        mappings written after it would be looked up instead of generated
+        and shift the Faker random stream.
+        """
+        if self._store is not None:
+            self._store.batch_size = None
+
+    def commit_store_writes(self):
+        """
+        Writes the pseudonym store mappings captured by the last checkpoint().
+        """
+        if self._store is not None:
+            self._store.flush()
+
+    def discard_store_writes(self):
+        """
+        Drops the pseudonym store mappings made since the last checkpoint().
+        """
+        if self._store is not None:
+            self._store.discard()
+
+    def restore(self, state):
+        """
+        Restores a state captured by checkpoint().
+
+        Args:
+            state (dict): The state.
+        """
+        self.stats.clear()
+        self.stats.update(state['stats'])
+        if self._pseudonyms is not None and state['pseudonyms'] is not None:
+            self._pseudonyms.load((tuple(key), value) for key, value in state['pseudonyms'])
+        if self._store is not None and state.get('store_pending'):
+            # The run may have stopped before these were committed.
+            self._store.write(state['store_pending'])
+        if self.faker is not None and state['faker_random'] is not None:
+            version, internal, gauss = state['faker_random']
+            self.faker.random.setstate((version, tuple(internal), gauss))
+
+    def restricted(self, names):
+        """
+        Returns a replacer that applies only the named patterns.
+
+        The restricted replacer shares compiled patterns, Faker state, pools,
+        pseudonym caches and stats with this one; only this replacer should be
+        closed.  Restricted replacers are built once per set of names.
+
+        Args:
+            names (iterable): The names of the patterns to keep.
+
+        Returns:
+            DataPatternReplacer: The restricted replacer.
+        """
+        names = frozenset(names)
+        subset = self._restricted.get(names)
+        if subset is None:
+            subset = copy.copy(self)
+            subset._restricted = {}
+            subset.compiled_patterns = tuple(entry for entry in self.compiled_patterns if entry.name in names)
+            subset._build_combined()
+            subset._build_prefilter()
+            self._restricted[names] = subset
+        return subset
+
+    def close(self):
+        """
+        Releases background resources such as the Faker pool refill.
+        """
+        if self._faker_pool is not None:
+            self._faker_pool.close()
+        if self._store is not None:
+            self._store.close()
+
+    def log_stats(self):
+        """
+        Logs the counters collected while processing.
+        """
+        scanned = self.stats['fields_scanned']
+        if scanned:
+            logging.info(f"Prefilter short-circuited {self.stats['fields_skipped']} of {scanned} fields.")
+        lookups = self.stats['pseudonym_cache_hits'] + self.stats['pseudonym_cache_misses']
+        if lookups:
+            logging.info(f"Pseudonym cache: {self.stats['pseudonym_cache_hits']} hits, "
+                         f"{self.stats['pseudonym_cache_misses']} misses, "
+                         f"{self.stats['pseudonym_cache_evictions']} evictions.")
+        if self._store is not None:
+            logging.info(f"Pseudonym store: {self.stats['pseudonym_store_hits']} hits, "
+                         f"{self.stats['pseudonym_store_misses']} misses.")
+        if self.stats['faker_pool_misses']:
+            logging.info(f"Faker pool ran dry {self.stats['faker_pool_misses']} times; "
+                         f"consider a larger --faker_pool_size.")
+        if self.stats['timeouts']:
+            per_pattern = ', '.join(f"{key.split('.', 1)[1]}: {count}" for key, count in sorted(self.stats.items())
+                                    if key.startswith('timeouts.'))
+            logging.warning(f"Match timeout expired {self.stats['timeouts']} times "
+                            f"(policy: {self.timeout_policy}; {per_pattern}).")
+
+    def _apply(self, name, regex, replacement, data, on_skip=None):
+        """
+        Runs ``regex.sub`` under the match timeout, if one is configured.
+
+        Args:
+            name (str): The pattern name, used for counters and errors.
+            regex: The compiled pattern.
+            replacement (str or callable): The replacement passed to ``sub``.
+            data (str): The input data.
+            on_skip (callable): Called with the data when the timeout expires
+                                under the 'skip' policy, to produce the result
+                                instead of the unchanged data.
+
+        Returns:
+            str: The result of the substitution, or the unchanged data if the
+                 timeout expired under the 'skip' policy.
+
+        Raises:
+            PatternTimeoutError: If the timeout expired under the 'fail' policy.
+        """
+        deadline = self._deadline
+        if deadline is None or not deadline.available:
+            return regex.sub(replacement, data)
+        try:
+            with deadline:
+                return regex.sub(replacement, data)
+        except PatternTimeoutError:
+            self.stats['timeouts'] += 1
+            self.stats[f'timeouts.{name}'] += 1
+            if self.timeout_policy == 'fail':
+                raise PatternTimeoutError(f"Pattern '{name}' exceeded the match timeout of "
+                                          f"{deadline.seconds}s on input of length {len(data)}") from None
+            if self.timeout_policy == 'mask':
+                raise _FieldMasked()
+            return data if on_skip is None else on_skip(data)
+
+    def _build_combined(self):
+        """
+        Builds the single alternation used by the combined engine.
+
+        Each pattern is wrapped in its own capturing group; the index of that
+        group identifies the pattern that produced a match.  Patterns that
+        cannot be embedded, including those that fell back to another regex
+        backend, are kept aside and applied as separate passes.
+        """
+        self._combined_regex = None
+        self._combined_groups = {}
+        self._combined_indices = []
+        self._combined_patterns = ()
+        self._separate_patterns = ()
+        if self.engine != 'combined':
+            return
+
+        empty = self.regex_backend.compile('')
+        parts = []
+        separate = []
+        group_names = set()
+        group_index = 1
+        for position, entry in enumerate(self.compiled_patterns):
+            names = set(getattr(entry.regex, 'groupindex', {}))
+            if (type(entry.regex) is not type(empty)
+                    or getattr(entry.regex, 'flags', 0) & ~getattr(empty, 'flags', 0)
+                    or names & group_names or _UNCOMBINABLE_RE.search(entry.regex.pattern)):
+                separate.append(entry)
+                continue
+            parts.append(f"({entry.regex.pattern})")
+            group_names |= names
+            self._combined_groups[group_index] = position
+            group_index += entry.regex.groups + 1
+
+        if parts:
+            try:
+                self._combined_regex = self.regex_backend.compile('|'.join(parts))
+                self._combined_indices = sorted(self._combined_groups)
+                self._combined_patterns = tuple(self.compiled_patterns[self._combined_groups[index]]
+                                                for index in self._combined_indices)
+            except Exception as e:
+                logging.warning(f"Could not build the combined pattern ({e}). Applying patterns one at a time.")
+                self._combined_groups = {}
+                separate = list(self.compiled_patterns)
+        self._separate_patterns = tuple(separate)
+        if separate:
+            logging.info(f"Patterns applied as separate passes by the combined engine: "
+                         f"{', '.join(entry.name for entry in separate)}")
+
+    def _replace_combined(self, data):
+        """
+        Replaces all patterns in a single scan of the input.
+
+        Args:
+            data (str): The input data to sanitize.
+
+        Returns:
+            str: The sanitized data.
+        """
+        if self._combined_regex is not None:
+            entries = self.compiled_patterns
+            groups = self._combined_groups
+            indices = self._combined_indices
+
+            def dispatch(match):
+                position = groups.get(match.lastindex)
+                if position is None:
+                    # Some backends report the innermost group; map it to its pattern.
+                    position = groups[indices[bisect_right(indices, match.lastindex) - 1]]
+                replacement = entries[position].repl
+                if callable(replacement):
+                    return replacement(match)
+                if '\\' in replacement:
+                    # Re-run the pattern alone so the template sees its own groups.
+                    return entries[position].regex.match(match.string, match.start()).expand(replacement)
+                return replacement
+
+            # When the scan times out under 'skip', apply the combined patterns
+            # one at a time so that only the slow one is skipped.
+            data = self._apply('<combined>', self._combined_regex, dispatch, data, self._replace_each)
+
+        for entry in self._separate_patterns:
+            data = self._apply(entry.name, entry.regex, entry.repl, data)
+        return data
+
+    def _replace_each(self, data):
+        """
+        Applies the patterns of the combined alternation one at a time.
+
+        Args:
+            data (str): The input data.
+
+        Returns:
+            str: The sanitized data.
+        """
+        for entry in self._combined_patterns:
+            data = self._apply(entry.name, entry.regex, entry.repl, data)
+        return data
+
+    def replace_patterns(self, data):
+        """
+        Replaces sensitive data patterns in the input data.
+
+        Args:
+            data (str): The input data to sanitize.
+
+        Returns:
+            str: The sanitized data.
+        """
+        try:
+            self.stats['fields_scanned'] += 1
+            if self._prefilter is not None and not self._prefilter(data):
+                self.stats['fields_skipped'] += 1
+                return data
+
+            if self.engine == 'combined':
+                return self._replace_combined(data)
+
+            for entry in self.compiled_patterns:
+                if entry.prefilter is not None and not entry.prefilter(data):
+                    continue
+                data = self._apply(entry.name, entry.regex, entry.repl, data)
+
+            return data
+        except _FieldMasked:
+            # Keep the line ending so masked text lines stay separate lines.
+            return self.timeout_mask + data[len(data.rstrip('\r\n')):]
+        except Exception as e:
+            logging.error(f"Error during pattern replacement: {e}")
+            raise
+
+def setup_argparse():
+    """
+    Sets up the argparse command-line interface.
+
+    Returns:
+        argparse.ArgumentParser: The argument parser.
+    """
+    parser = argparse.ArgumentParser(description='Sanitize data by replacing sensitive patterns.')
+    parser.add_argument('input_file', type=str, help='Path to the input file, or an input directory or glob pattern for batch mode.')
+    parser.add_argument('output_file', type=str, help='Path to the output file, or the output directory in batch mode.')
+    parser.add_argument('--patterns_file', type=str, help='Path to the JSON file containing regex patterns and replacements.', required=True)
+    parser.add_argument('--use_faker', action='store_true', help='Use Faker to generate realistic replacement data.')
+    parser.add_argument('--faker_locale', type=str, default='en_US', help='Locale to use for Faker (default: en_US).')
+    parser.add_argument('--faker_pool_size', type=int, default=0, help='Pre-generate this many values per Faker provider and serve replacements from the pool (default: 0, disabled).')
+    parser.add_argument('--faker_pool_reuse', type=str, choices=POOL_REUSE_POLICIES, default='none', help='"none" serves each pooled value once and refills in the background, "cycle" reuses a fixed pool (default: none).')
+    parser.add_argument('--faker_pool_refill', type=str, choices=POOL_REFILL_MODES, default='thread', help='Refill pools from background threads or processes; processes generate values on other cores (default: thread).')
+    parser.add_argument('--faker_pool_workers', type=int, default=1, help='Number of background threads or processes refilling the Faker pools (default: 1).')
+    parser.add_argument('--pseudonym_cache_size', type=int, default=0, help='Remember up to this many original values so that repeats get the same Faker value within a run (default: 0, disabled).')
+    parser.add_argument('--deterministic_pseudonyms', action='store_true', help='Derive every Faker value from an HMAC of the original so the same value gets the same pseudonym in every process and run. Requires a key in the DATASCAN_PSEUDONYM_KEY environment variable or --pseudonym_key_file.')
+    parser.add_argument('--pseudonym_key_file', type=str, help='Path to a file holding the secret key for deterministic pseudonyms (default: the DATASCAN_PSEUDONYM_KEY environment variable).')
+    parser.add_argument('--pseudonym_store', type=str, help='Path to a local SQLite file that persists Faker pseudonyms so later runs reuse them. Compact it with the "compact-store" command.')
+    parser.add_argument('--input_format', type=str, choices=['text', 'json', 'jsonl', 'csv', 'auto'], default='text', help='Format of the input file; "auto" infers it from the extension (default: text).')
+    parser.add_argument('--output_format', type=str, choices=['text', 'json', 'jsonl', 'csv'], default=None, help='Format of the output file (default: same as the input format).')
+    parser.add_argument('--no_prefilter', action='store_true', help='Disable the literal prefilter that skips inputs which cannot match any pattern.')
+    parser.add_argument('--workers', type=int, default=1, help='Number of worker processes for text, CSV and JSON Lines input, or for the files of a batch (default: 1).')
+    parser.add_argument('--encoding', type=str, default=None, help="Encoding of text input and output (default: the locale's preferred encoding).")
+    parser.add_argument('--binary', action='store_true', help='Scan text input as bytes over a memory-mapped file instead of decoding it line by line.')
+    parser.add_argument('--compression_level', type=int, default=None, help='Compression level for output files ending in .gz, .bz2, .xz or .zst (default: the format\'s default).')
+    parser.add_argument('--incremental', action='store_true', help=f'In batch mode, skip files unchanged since the last run with the same patterns and options, as recorded in {MANIFEST_NAME} in the output directory.')
+    parser.add_argument('--shard', type=parse_shard, default=None, help='Process only shard i of N (i/N, 0 <= i < N): a line- or row-aligned byte range of a text, CSV or JSON Lines file. Join the shard outputs with the "merge" command.')
+    parser.add_argument('--checkpoint', type=str, default=None, help='Periodically save progress of text and CSV processing to this file, and resume from it after an interruption.')
+    parser.add_argument('--checkpoint_interval', type=float, default=60, help='Seconds between checkpoints (default: 60).')
+    parser.add_argument('--report', type=str, default=None, help='In batch mode, write the per-file results to this JSON file.')
+    parser.add_argument('--stream_json', action='store_true', help='Process JSON input incrementally with constant memory instead of loading the whole document.')
+    parser.add_argument('--compact_json', action='store_true', help='Write JSON output on a single line instead of indenting it.')
+    parser.add_argument('--engine', type=str, choices=ENGINES, default='sequential', help='Matching engine: "sequential" applies patterns one after another, "combined" scans the input once with all patterns (default: sequential).')
+    parser.add_argument('--match_timeout', type=float, default=None, help='Maximum seconds a pattern may spend on a single input (default: no limit).')
+    parser.add_argument('--timeout_policy', type=str, choices=TIMEOUT_POLICIES, default='fail', help='Action when --match_timeout expires: fail the record, mask the whole field, or skip the pattern (default: fail).')
+    parser.add_argument('--timeout_mask', type=str, default='[REDACTED]', help='Replacement for a whole field under --timeout_policy mask (default: [REDACTED]).')
+    parser.add_argument('--analyze_patterns', action='store_true', help='Statically analyze the patterns for catastrophic backtracking and report their estimated worst-case complexity before processing.')
+    parser.add_argument('--strict_patterns', action='store_true', help='Refuse to run if a pattern can backtrack exponentially or above O(n^4) (implies --analyze_patterns).')
+    parser.add_argument('--regex_backend', type=str, choices=REGEX_BACKENDS, default='re', help='Module used to compile regex patterns. "re2" guarantees linear-time matching; unsupported patterns fall back to "re" (default: re).')
+
+    return parser
+
+
+def analyze_patterns(patterns):
+    """
+    Runs the static backtracking analysis over every regex pattern and logs a report.
+
+    Args:
+        patterns (dict): The patterns from the patterns file.
+
+    Returns:
+        dict: Pattern names mapped to their PatternAnalysis.
+    """
+    results = {}
+    for pattern_name, pattern in patterns.items():
+        if isinstance(pattern, dict) and pattern.get('type', 'regex') == 'regex':
+            pattern = pattern.get('pattern')
+        if not isinstance(pattern, str):
+            continue
+        try:
+            analysis = analyze_pattern(pattern)
+        except re.error:
+            # Invalid patterns are reported when they are compiled.
+            continue
+        results[pattern_name] = analysis
+        if analysis.issues:
+            logging.warning(f"Pattern '{pattern_name}' may backtrack catastrophically: worst case "
+                            f"{analysis.complexity} ({'; '.join(analysis.issues)}).")
+    flagged = sum(1 for analysis in results.values() if analysis.issues)
+    logging.info(f"Analyzed {len(results)} regex patterns: {flagged} flagged for excessive backtracking.")
+    return results
+
+
+def setup_compact_argparse():
+    """
+    Sets up the command-line interface of the compact-store command.
+
+    Returns:
+        argparse.ArgumentParser: The argument parser.
+    """
+    parser = argparse.ArgumentParser(prog='compact-store', description='Compact a pseudonym store.')
+    parser.add_argument('store', type=str, help='Path to the pseudonym store (SQLite file).')
+    return parser
+
+
+def setup_merge_argparse():
+    """
+    Sets up the command-line interface of the merge command.
+
+    Returns:
+        argparse.ArgumentParser: The argument parser.
+    """
+    parser = argparse.ArgumentParser(prog='merge', description='Concatenate the outputs of a sharded run.')
+    parser.add_argument('output_file', type=str, help='Path to the merged output file.')
+    parser.add_argument('shard_files', type=str, nargs='+', help='Paths to the shard outputs, in shard order (0 to N-1).')
+    return parser
+
+
+def load_pseudonym_key(key_file=None):
+    """
+    Loads the secret key for deterministic pseudonyms.
+
+    Args:
+        key_file (str): Path to a file holding the key.  When omitted, the
+                        DATASCAN_PSEUDONYM_KEY environment variable is used.
+
+    Returns:
+        bytes: The key, or None if none is configured.
+    """
+    if key_file:
+        try:
+            with open(key_file, 'rb') as f:
+                return f.read().strip() or None
+        except FileNotFoundError:
+            logging.error(f"Pseudonym key file not found: {key_file}")
+            raise
+    key = os.environ.get('DATASCAN_PSEUDONYM_KEY')
+    return key.encode('utf-8') if key else None
+
+
+def load_patterns_from_json(patterns_file, analyze=False, strict=False):
+    """
+    Loads patterns and replacements from a JSON file.
+
+    The "terms_file" of dictionary patterns is resolved relative to the
+    directory of the patterns file.
+
+    Args:
+        patterns_file (str): Path to the JSON file.
+        analyze (bool): Whether to run the static backtracking analysis and log its report.
+        strict (bool): Whether to reject patterns with exponential worst-case backtracking,
+                       or polynomial above degree STRICT_MAX_DEGREE.  Implies analyze.
+
+    Returns:
+        tuple: A tuple containing patterns (dict) and replacements (dict).
+
+    Raises:
+        ValueError: If strict is set and a pattern can backtrack catastrophically.
+    """
+    try:
+        with open(patterns_file, 'r') as f:
+            data = json.load(f)
+            patterns = data.get('patterns', {})
+            replacements = data.get('replacements', {})
+            base_dir = os.path.dirname(os.path.abspath(patterns_file))
+            for spec in patterns.values():
+                if isinstance(spec, dict) and spec.get('terms_file'):
+                    spec['terms_file'] = os.path.join(base_dir, spec['terms_file'])
+        if analyze or strict:
+            results = analyze_patterns(patterns)
+            rejected = [name for name, analysis in results.items()
+                        if analysis.complexity == 'O(2^n)' or analysis.degree > STRICT_MAX_DEGREE]
+            if strict and rejected:
+                raise ValueError(f"Patterns with catastrophic backtracking: {', '.join(rejected)}")
+        return patterns, replacements
+    except FileNotFoundError:
+        logging.error(f"Patterns file not found: {patterns_file}")
+        raise
+    except json.JSONDecodeError:
+        logging.error(f"Invalid JSON format in patterns file: {patterns_file}")
+        raise
+    except Exception as e:
+        logging.error(f"Error loading patterns from JSON: {e}")
+        raise
+
+def _rule_errors(rules, patterns):
+    """
+    Validates (target, action) pairs from a rules section of the patterns file.
+
+    Returns:
+        list: A message per action that is neither a list of known pattern
+              names nor one of RULE_ACTIONS.
+    """
+    errors = []
+    for target, action in rules:
+        if isinstance(action, list):
+            unknown = [name for name in action if name not in patterns]
+            if unknown:
+                errors.append(f"{target}: unknown pattern(s) {', '.join(map(str, unknown))}")
+        elif action not in RULE_ACTIONS:
+            errors.append(f"{target}: expected a list of pattern names or one of {', '.join(RULE_ACTIONS)}")
+    return errors
+
+
+def _action_sanitizer(action, replacer):
+    """
+    Returns the function applying a rule action other than "mask" to a string,
+    or None if the action is "skip".
+    """
+    if action == 'skip':
+        return None
+    if action == 'all':
+        return replacer.replace_patterns
+    return replacer.restricted(action).replace_patterns
+
+
+def load_json_path_rules(patterns_file):
+    """
+    Loads the key-path JSON rules from the patterns file.
+
+    "json_paths" maps selectors to a list of pattern names or to one of "all",
+    "skip" or "mask"; "json_default" is the action outside every selector
+    (default: "all") and "json_mask" the text masked values are replaced with.
+
+    Args:
+        patterns_file (str): Path to the JSON file.
+
+    Returns:
+        JsonPathRules: The rules, or None if the file declares no path rules.
+
+    Raises:
+        ValueError: If a selector or a rule is invalid.
+    """
+    with open(patterns_file, 'r') as f:
+        data = json.load(f)
+    if 'json_paths' not in data and 'json_default' not in data:
+        return None
+    selectors = data.get('json_paths', {})
+    default = data.get('json_default', 'all')
+    errors = _rule_errors(list(selectors.items()) + [('json_default', default)], data.get('patterns', {}))
+    for selector in selectors:
+        try:
+            _parse_json_selector(selector)
+        except ValueError as e:
+            errors.append(str(e))
+    if errors:
+        raise ValueError(f"Invalid JSON path rule(s) in patterns file: {'; '.join(errors)}")
+    return JsonPathRules(selectors, default, data.get('json_mask', '[REDACTED]'))
+
+
+def load_csv_column_rules(patterns_file):
+    """
+    Loads the per-column CSV rules from the patterns file.
+
+    "csv_columns" maps a header name, or a 0-based column index written as a
+    string, to a list of pattern names or to one of "all", "skip" or "mask".
+    "csv_default" is the action for columns without a rule (default: "all")
+    and "csv_mask" the text that masked fields are replaced with.
+
+    Args:
+        patterns_file (str): Path to the JSON file.
+
+    Returns:
+        CsvColumnRules: The rules, or None if the file declares no column rules.
+
+    Raises:
+        ValueError: If a rule is not a list of pattern names or a known action.
+    """
+    with open(patterns_file, 'r') as f:
+        data = json.load(f)
+    if 'csv_columns' not in data and 'csv_default' not in data:
+        return None
+    columns = data.get('csv_columns', {})
+    default = data.get('csv_default', 'all')
+    errors = _rule_errors(list(columns.items()) + [('csv_default', default)], data.get('patterns', {}))
+    if errors:
+        raise ValueError(f"Invalid CSV column rule(s) in patterns file: {'; '.join(errors)}")
+    return CsvColumnRules(columns, default, data.get('csv_mask', '[REDACTED]'))
+
+
+def _csv_column_sanitizers(header, replacer, rules, quiet=False):
+    """
+    Resolves the column rules against a header row.
+
+    A rule for the header name takes precedence over a rule for the column's
+    index.
+
+    Args:
+        header (list): The header row.
+        replacer (DataPatternReplacer): The DataPatternReplacer instance.
+        rules (CsvColumnRules): The column rules.
+        quiet (bool): Whether to leave out the log line summarizing the rules.
+
+    Returns:
+        callable: Maps a column index to the function sanitizing that column's
+                  fields, or None if the column is passed through.
+    """
+    mask = rules.mask
+
+    def masked(field):
+        return mask if field else field
+
+    def resolve(index):
+        name = header[index] if index < len(header) else None
+        action = rules.columns.get(name, rules.columns.get(str(index), rules.default))
+        if action == 'skip':
+            return None
+        if action == 'mask':
+            return masked
+        return _action_sanitizer(action, replacer)
+
+    sanitizers = [resolve(index) for index in range(len(header))]
+    scanned = sum(sanitizer is not None and sanitizer is not masked for sanitizer in sanitizers)
+    if not quiet:
+        logging.info(f"CSV column rules: {scanned} of {len(header)} columns scanned.")
+
+    def sanitizer_for(index):
+        while index >= len(sanitizers):
+            sanitizers.append(resolve(len(sanitizers)))
+        return sanitizers[index]
+
+    return sanitizer_for
+
+
+def _sanitize_row(row, sanitizer_for):
+    """
+    Sanitizes a CSV row with per-column sanitizers.
+    """
+    sanitized = []
+    for index, field in enumerate(row):
+        sanitizer = sanitizer_for(index)
+        sanitized.append(field if sanitizer is None else sanitizer(field))
+    return sanitized
+
+
+def detect_compression(path, reading=True):
+    """
+    Works out the compression format of a file.
+
+    Input files are identified by their magic bytes, falling back to the
+    extension; output files by their extension.
+
+    Args:
+        path (str): Path to the file.
+        reading (bool): Whether the file is an existing input.
+
+    Returns:
+        str: 'gzip', 'bz2', 'xz' or 'zstd', or None for an uncompressed file.
+    """
+    if reading:
+        with open(path, 'rb') as f:
+            head = f.read(6)
+        for magic, compression in COMPRESSION_MAGIC:
+            if head.startswith(magic):
+                return compression
+    return COMPRESSION_EXTENSIONS.get(os.path.splitext(path)[1].lower())
+
+
+class _ThreadedReader(io.RawIOBase):
+    """
+    Reads a binary stream ahead on a background thread.
+
+    Used for decompression, so that inflating the input overlaps with regex
+    work on the main thread.  At most ``depth`` chunks are buffered.
+    """
+
+    def __init__(self, raw, chunk_size=DECOMPRESS_CHUNK_SIZE, depth=4):
+        super().__init__()
+        self._raw = raw
+        self._chunk_size = chunk_size
+        self._chunks = queue.Queue(maxsize=depth)
+        self._stop = threading.Event()
+        self._pending = memoryview(b'')
+        self._eof = False
+        self._thread = threading.Thread(target=self._fill, daemon=True)
+        self._thread.start()
+
+    def _put(self, item):
+        while not self._stop.is_set():
+            try:
+                self._chunks.put(item, timeout=0.1)
+                return
+            except queue.Full:
+                pass
+
+    def _fill(self):
+        try:
+            while not self._stop.is_set():
+                chunk = self._raw.read(self._chunk_size)
+                self._put(chunk)
+                if not chunk:
+                    return
+        except Exception as e:
+            self._put(e)
+
+    def readable(self):
+        return True
+
+    def readinto(self, buffer):
+        if not self._pending:
+            if self._eof:
+                return 0
+            chunk = self._chunks.get()
+            if isinstance(chunk, Exception):
+                raise chunk
+            if not chunk:
+                self._eof = True
+                return 0
+            self._pending = memoryview(chunk)
+        size = min(len(buffer), len(self._pending))
+        buffer[:size] = self._pending[:size]
+        self._pending = self._pending[size:]
+        return size
+
+    def close(self):
+        if not self.closed:
+            self._stop.set()
+            self._thread.join()
+            self._raw.close()
+        super().close()
+
+
+class _ByteRange(io.RawIOBase):
+    """
+    Reads the bytes of a file between two offsets.
+    """
+
+    def __init__(self, path, start, end):
+        super().__init__()
+        self._file = open(path, 'rb')
+        self._file.seek(start)
+        self._remaining = end - start
+
+    def readable(self):
+        return True
+
+    def readinto(self, buffer):
+        size = min(len(buffer), self._remaining)
+        if size <= 0:
+            return 0
+        size = self._file.readinto(memoryview(buffer)[:size])
+        self._remaining -= size
+        return size
+
+    def close(self):
+        if not self.closed:
+            self._file.close()
+        super().close()
+
+
+def open_input(path, newline=None, encoding=None, byte_range=None):
+    """
+    Opens an input file for reading text, decompressing it if needed.
+
+    Compressed input is decompressed on a background thread.
+
+    Args:
+        path (str): Path to the file.
+        newline: As for open().
+        encoding (str): As for open().
+        byte_range (tuple): The start and end offsets of the part of the file
+                            to read, or None to read all of it.
+
+    Returns:
+        file: A text file object.
+
+    Raises:
+        ValueError: If the file is zstd-compressed and zstandard is not
+                    installed, or a byte range of a compressed file is requested.
+    """
+    compression = detect_compression(path)
+    if byte_range is not None:
+        if compression is not None:
+            raise ValueError(f"{path} is compressed and cannot be read by byte range")
+        return io.TextIOWrapper(io.BufferedReader(_ByteRange(path, *byte_range)), encoding=encoding, newline=newline)
+    if compression is None:
+        return open(path, 'r', newline=newline, encoding=encoding)
+    if compression == 'gzip':
+        raw = gzip.open(path, 'rb')
+    elif compression == 'bz2':
+        raw = bz2.open(path, 'rb')
+    elif compression == 'xz':
+        raw = lzma.open(path, 'rb')
+    else:
+        if zstandard is None:
+            raise ValueError(f"{path} is zstd-compressed; install the 'zstandard' package to read it")
+        raw = zstandard.ZstdDecompressor().stream_reader(open(path, 'rb'), closefd=True)
+    reader = io.BufferedReader(_ThreadedReader(raw), DECOMPRESS_CHUNK_SIZE)
+    return io.TextIOWrapper(reader, encoding=encoding, newline=newline)
+
+
+def open_output(path, newline=None, encoding=None, level=None):
+    """
+    Opens an output file for writing text, compressing it if its extension
+    names a compression format.
+
+    Args:
+        path (str): Path to the file.
+        newline: As for open().
+        encoding (str): As for open().
+        level (int): The compression level (default: the format's default).
+
+    Returns:
+        file: A text file object.
+
+    Raises:
+        ValueError: If zstd output is requested and zstandard is not installed.
+    """
+    compression = detect_compression(path, reading=False)
+    if compression is None:
+        return open(path, 'w', newline=newline, encoding=encoding)
+    if compression == 'gzip':
+        raw = gzip.open(path, 'wb', compresslevel=9 if level is None else level)
+    elif compression == 'bz2':
+        raw = bz2.open(path, 'wb', compresslevel=9 if level is None else level)
+    elif compression == 'xz':
+        raw = lzma.open(path, 'wb', preset=level)
+    else:
+        if zstandard is None:
+            raise ValueError(f"install the 'zstandard' package to write zstd-compressed output to {path}")
+        compressor = zstandard.ZstdCompressor(level=3 if level is None else level)
+        raw = compressor.stream_writer(open(path, 'wb'), closefd=True)
+    return io.TextIOWrapper(raw, encoding=encoding, newline=newline)
+
+
+def _read_csv_header(input_file):
+    """
+    Reads the first row of a CSV file.
+
+    Returns:
+        list: The header, or None if the file is empty.
+    """
+    with open_input(input_file, newline='') as infile:
+        return next(csv.reader(infile), None)
+
+
+def process_csv_file(input_file, output_file, replacer, column_rules=None, compression_level=None, byte_range=None):
+    """
+    Processes a CSV file, sanitizing each field.
+
+    With column rules the first row is taken as the header and written
+    unchanged, and every other field is sanitized according to its column's rule.
+
+    Args:
+        input_file (str): Path to the input CSV file.
+        output_file (str): Path to the output CSV file.
+        replacer (DataPatternReplacer): The DataPatternReplacer instance.
+        column_rules (CsvColumnRules): Per-column rules, or None to sanitize every field.
+        compression_level (int): The output compression level, for compressed output.
+        byte_range (tuple): The row-aligned start and end offsets of the part
+                            of the input to process, or None for all of it.
+                            A range not starting the file is written without
+                            the header.
+    """
+    try:
+        with open_input(input_file, newline='', byte_range=byte_range) as infile, \
+                open_output(output_file, newline='', level=compression_level) as outfile:
+            reader = csv.reader(infile)
+            writer = csv.writer(outfile)
+            if column_rules is not None:
+                if byte_range is None or byte_range[0] == 0:
+                    header = next(reader, None)
+                    if header is None:
+                        return
+                    writer.writerow(header)
+                else:
+                    header = _read_csv_header(input_file)
+                sanitizer_for = _csv_column_sanitizers(header, replacer, column_rules)
+                for row in reader:
+                    writer.writerow(_sanitize_row(row, sanitizer_for))
+                return
+
+            for row in reader:
+                sanitized_row = [replacer.replace_patterns(field) for field in row]
+                writer.writerow(sanitized_row)
+    except FileNotFoundError:
+        logging.error(f"Input file not found: {input_file}")
+        raise
+    except Exception as e:
+        logging.error(f"Error processing CSV file: {e}")
+        raise
+
+_JSON_WHITESPACE = re.compile(r'[ \t\n\r]*')
+_JSON_NUMBER = re.compile(r'(-?(?:0|[1-9]\d*))(\.\d+)?([eE][-+]?\d+)?')
+_JSON_NUMBER_CHARS = re.compile(r'[-+.eE0-9]*')
+_JSON_CONSTANTS = (
+    ('true', 'boolean', True),
+    ('false', 'boolean', False),
+    ('null', 'null', None),
+    ('NaN', 'constant', 'NaN'),
+    ('Infinity', 'constant', 'Infinity'),
+    ('-Infinity', 'constant', '-Infinity'),
+)
+
+
+class JsonEventReader:
+    """
+    Incrementally tokenizes a JSON document into parse events.
+
+    Reads the input in chunks and yields ``(event, value)`` tuples:
+    'start_map', 'map_key', 'end_map', 'start_array', 'end_array', 'string',
+    'number' (with the raw number text), 'boolean', 'null' and 'constant'
+    (NaN and the infinities, which ``json.load`` also accepts).  Memory use
+    is bounded by the chunk size and the longest single token, not by the
+    document size.
+    """
+
+    def __init__(self, fp, chunk_size=1 << 16):
+        """
+        Initializes the JsonEventReader.
+
+        Args:
+            fp (file): A text file object positioned at the start of the document.
+            chunk_size (int): The number of characters read at a time.
+        """
+        self.fp = fp
+        self.chunk_size = chunk_size
+        self._buffer = ''
+        self._pos = 0
+        self._eof = False
+
+    def _read(self, at_least=0):
+        """
+        Appends the next chunk to the buffer, dropping consumed input.
+
+        Returns:
+            bool: False at the end of the input.
+        """
+        if self._eof:
+            return False
+        chunk = self.fp.read(max(self.chunk_size, at_least))
+        if not chunk:
+            self._eof = True
+            return False
+        self._buffer = self._buffer[self._pos:] + chunk
+        self._pos = 0
+        return True
+
+    def _error(self, message):
+        raise json.JSONDecodeError(message, self._buffer, self._pos)
+
+    def _peek(self):
+        """
+        Skips whitespace and returns the next character, or '' at the end of the input.
+        """
+        while True:
+            self._pos = _JSON_WHITESPACE.match(self._buffer, self._pos).end()
+            if self._pos < len(self._buffer):
+                return self._buffer[self._pos]
+            if not self._read():
+                return ''
+
+    def _string(self):
+        """
+        Parses the string starting at the current quote.
+        """
+        while True:
+            try:
+                value, self._pos = scanstring(self._buffer, self._pos + 1)
+                return value
+            except json.JSONDecodeError:
+                # The string may continue in the next chunk; read at least as
+                # much again so that long strings are rescanned O(log n) times.
+                if not self._read(len(self._buffer) - self._pos):
+                    raise
+
+    def _scalar(self):
+        """
+        Parses a number or a literal constant.
+        """
+        end = _JSON_NUMBER_CHARS.match(self._buffer, self._pos).end()
+        while (end == len(self._buffer) or len(self._buffer) - self._pos < 9) and self._read():
+            end = _JSON_NUMBER_CHARS.match(self._buffer, self._pos).end()
+        match = _JSON_NUMBER.match(self._buffer, self._pos)
+        if match is not None:
+            self._pos = match.end()
+            return 'number', match.group(0)
+        for text, event, value in _JSON_CONSTANTS:
+            if self._buffer.startswith(text, self._pos):
+                self._pos += len(text)
+                return event, value
+        self._error('Expecting value')
+
+    def _key(self):
+        """
+        Parses an object key and the colon that follows it.
+        """
+        if self._peek() != '"':
+            self._error('Expecting property name enclosed in double quotes')
+        key = self._string()
+        if self._peek() != ':':
+            self._error("Expecting ':' delimiter")
+        self._pos += 1
+        return key
+
+    def __iter__(self):
+        stack = []
+        state = 'value'
+        while True:
+            if state == 'value':
+                char = self._peek()
+                if char == '{':
+                    self._pos += 1
+                    stack.append('map')
+                    yield 'start_map', None
+                    if self._peek() == '}':
+                        self._pos += 1
+                        stack.pop()
+                        yield 'end_map', None
+                        state = 'after'
+                    else:
+                        yield 'map_key', self._key()
+                    continue
+                if char == '[':
+                    self._pos += 1
+                    stack.append('array')
+                    yield 'start_array', None
+                    if self._peek() == ']':
+                        self._pos += 1
+                        stack.pop()
+                        yield 'end_array', None
+                        state = 'after'
+                    continue
+                if char == '"':
+                    yield 'string', self._string()
+                elif char:
+                    yield self._scalar()
+                else:
+                    self._error('Expecting value')
+                state = 'after'
+                continue
+
+            char = self._peek()
+            if not stack:
+                if char:
+                    self._error('Extra data')
+                return
+            if char == ',':
+                self._pos += 1
+                if stack[-1] == 'map':
+                    yield 'map_key', self._key()
+                state = 'value'
+            elif char == ('}' if stack[-1] == 'map' else ']'):
+                self._pos += 1
+                yield ('end_map' if stack.pop() == 'map' else 'end_array'), None
+            else:
+                self._error("Expecting ',' delimiter")
+
+
+def _format_json_number(raw):
+    """
+    Formats raw number text the way ``json.dump`` writes the parsed number.
+    """
+    if '.' in raw or 'e' in raw or 'E' in raw:
+        value = float(raw)
+        if value == float('inf'):
+            return 'Infinity'
+        if value == float('-inf'):
+            return '-Infinity'
+        return float.__repr__(value)
+    return int.__repr__(int(raw))
+
+
+class JsonEventWriter:
+    """
+    Writes parse events back out as JSON, byte for byte as ``json.dump`` would
+    write the parsed document with the same ``indent``.
+    """
+
+    def __init__(self, fp, indent=4):
+        """
+        Initializes the JsonEventWriter.
+
+        Args:
+            fp (file): The text file object to write to.
+            indent (int): The indent of json.dump, or None for single-line output.
+        """
+        self.fp = fp
+        self.indent = ' ' * indent if indent is not None else None
+        self._counts = []
+        self._after_key = False
+
+    def _separate(self):
+        """
+        Writes the separator and indentation that precede the next value.
+        """
+        if self._after_key:
+            self._after_key = False
+            return
+        if not self._counts:
+            return
+        count = self._counts[-1]
+        self._counts[-1] = count + 1
+        if self.indent is None:
+            if count:
+                self.fp.write(', ')
+        else:
+            self.fp.write((',\n' if count else '\n') + self.indent * len(self._counts))
+
+    def write(self, event, value):
+        """
+        Writes a single parse event.
+
+        Args:
+            event (str): The event name, as produced by JsonEventReader.
+            value: The event value.
+        """
+        if event in ('end_map', 'end_array'):
+            count = self._counts.pop()
+            closing = '}' if event == 'end_map' else ']'
+            if count and self.indent is not None:
+                self.fp.write('\n' + self.indent * len(self._counts) + closing)
+            else:
+                self.fp.write(closing)
+            return
+
+        self._separate()
+        if event == 'map_key':
+            self.fp.write(encode_basestring_ascii(value) + ': ')
+            self._after_key = True
+        elif event == 'string':
+            self.fp.write(encode_basestring_ascii(value))
+        elif event == 'number':
+            self.fp.write(_format_json_number(value))
+        elif event == 'start_map':
+            self.fp.write('{')
+            self._counts.append(0)
+        elif event == 'start_array':
+            self.fp.write('[')
+            self._counts.append(0)
+        elif event == 'boolean':
+            self.fp.write('true' if value else 'false')
+        elif event == 'null':
+            self.fp.write('null')
+        else:
+            self.fp.write(value)
+
+
+def sanitize_json(obj, replacer, path_rules=None, state=None):
+    """
+    Recursively sanitizes the string values of a parsed JSON value.
+
+    Args:
+        obj: The parsed JSON value.
+        replacer (DataPatternReplacer): The DataPatternReplacer instance.
+        path_rules (JsonPathRules): Key-path rules, or None to sanitize every string.
+        state: The path rules state of ``obj`` (default: the document root).
+
+    Returns:
+        The sanitized value.
+    """
+    if path_rules is not None:
+        return _sanitize_json_paths(obj, replacer, path_rules, path_rules.root() if state is None else state)
+    if isinstance(obj, str):
+        return replacer.replace_patterns(obj)
+    elif isinstance(obj, dict):
+        return {k: sanitize_json(v, replacer) for k, v in obj.items()}
+    elif isinstance(obj, list):
+        return [sanitize_json(elem, replacer) for elem in obj]
+    else:
+        return obj
+
+
+def _sanitize_json_paths(obj, replacer, path_rules, state):
+    """
+    Sanitizes a parsed JSON value according to key-path rules.
+    """
+    action = state[1]
+    if action == 'mask':
+        return path_rules.mask
+    if path_rules.prunable(state):
+        return obj
+    if isinstance(obj, str):
+        sanitizer = _action_sanitizer(action, replacer)
+        return obj if sanitizer is None else sanitizer(obj)
+    elif isinstance(obj, dict):
+        return {k: _sanitize_json_paths(v, replacer, path_rules, path_rules.step(state, k)) for k, v in obj.items()}
+    elif isinstance(obj, list):
+        return [_sanitize_json_paths(elem, replacer, path_rules, path_rules.step(state, index))
+                for index, elem in enumerate(obj)]
+    else:
+        return obj
+
+
+def _sanitize_json_events(events, replacer, path_rules=None):
+    """
+    Sanitizes the string values of a stream of JsonEventReader events.
+
+    With key-path rules, pruned subtrees are passed through without being
+    examined and masked values are replaced by a single string event.
+
+    Args:
+        events (iterator): The parse events.
+        replacer (DataPatternReplacer): The DataPatternReplacer instance.
+        path_rules (JsonPathRules): Key-path rules, or None to sanitize every string.
+
+    Yields:
+        tuple: The sanitized events.
+    """
+    if path_rules is None:
+        for event, value in events:
+            if event == 'string':
+                value = replacer.replace_patterns(value)
+            yield event, value
+        return
+
+    # One entry per open container: [state, next array index or None, state of the next map value].
+    stack = []
+    for event, value in events:
+        if event == 'map_key':
+            stack[-1][2] = path_rules.step(stack[-1][0], value)
+            yield event, value
+            continue
+        if event in ('end_map', 'end_array'):
+            stack.pop()
+            yield event, value
+            continue
+
+        if not stack:
+            state = path_rules.root()
+        elif stack[-1][1] is None:
+            state = stack[-1][2]
+        else:
+            state = path_rules.step(stack[-1][0], stack[-1][1])
+            stack[-1][1] += 1
+
+        opens = event in ('start_map', 'start_array')
+        if state[1] == 'mask' or (opens and path_rules.prunable(state)):
+            masked = state[1] == 'mask'
+            yield ('string', path_rules.mask) if masked else (event, value)
+            depth = 1 if opens else 0
+            while depth:
+                event, value = next(events)
+                if event in ('start_map', 'start_array'):
+                    depth += 1
+                elif event in ('end_map', 'end_array'):
+                    depth -= 1
+                if not masked:
+                    yield event, value
+            continue
+        if opens:
+            stack.append([state, 0 if event == 'start_array' else None, None])
+        elif event == 'string':
+            sanitizer = _action_sanitizer(state[1], replacer)
+            if sanitizer is not None:
+                value = sanitizer(value)
+        yield event, value
+
+
+def process_json_file(input_file, output_file, replacer, streaming=False, indent=4, path_rules=None,
+                      compression_level=None):
+    """
+    Processes a JSON file, sanitizing string values.
+
+    In streaming mode the document is never loaded as a whole: string values
+    are sanitized as they stream from a JsonEventReader to a JsonEventWriter,
+    so memory use is constant regardless of file size.  The output is identical
+    to the in-memory path, except that duplicate keys are kept rather than
+    collapsed into the last one.
+
+    Args:
+        input_file (str): Path to the input JSON file.
+        output_file (str): Path to the output JSON file.
+        replacer (DataPatternReplacer): The DataPatternReplacer instance.
+        streaming (bool): Whether to process the file incrementally.
+        indent (int): The output indent, or None for compact single-line output.
+        path_rules (JsonPathRules): Key-path rules, or None to sanitize every string.
+        compression_level (int): The output compression level, for compressed output.
+    """
+    try:
+        with open_input(input_file) as infile, open_output(output_file, level=compression_level) as outfile:
+            if streaming:
+                writer = JsonEventWriter(outfile, indent)
+                for event, value in _sanitize_json_events(iter(JsonEventReader(infile)), replacer, path_rules):
+                    writer.write(event, value)
+                return
+
+            data = json.load(infile)
+            sanitized_data = sanitize_json(data, replacer, path_rules)
+            json.dump(sanitized_data, outfile, indent=indent)  # Add indent for readability
+    except FileNotFoundError:
+        logging.error(f"Input file not found: {input_file}")
+        raise
+    except json.JSONDecodeError:
+        logging.error(f"Invalid JSON format in input file: {input_file}")
+        raise
+    except Exception as e:
+        logging.error(f"Error processing JSON file: {e}")
+        raise
+
+
+def process_jsonl_file(input_file, output_file, replacer, batch_size=1000, path_rules=None, compression_level=None,
+                       byte_range=None):
+    """
+    Processes a JSON Lines file, sanitizing the string values of each record.
+
+    Each line is parsed, sanitized and written back as a single compact line,
+    and output is flushed every ``batch_size`` records, so at most one batch of
+    records is held in memory.  Blank lines are passed through unchanged.
+
+    Args:
+        input_file (str): Path to the input JSON Lines file.
+        output_file (str): Path to the output JSON Lines file.
+        replacer (DataPatternReplacer): The DataPatternReplacer instance.
+        batch_size (int): The number of records written at a time.
+        path_rules (JsonPathRules): Key-path rules applied to each record, or None.
+        compression_level (int): The output compression level, for compressed output.
+        byte_range (tuple): The line-aligned start and end offsets of the part
+                            of the input to process, or None for all of it.
+                            Line numbers in errors count from its start.
+    """
+    line_number = 0
+    try:
+        with open_input(input_file, byte_range=byte_range) as infile, open_output(output_file, level=compression_level) as outfile:
+            batch = []
+            for line_number, line in enumerate(infile, 1):
+                if line.strip():
+                    record = sanitize_json(json.loads(line), replacer, path_rules)
+                    line = json.dumps(record, separators=(',', ':')) + '\n'
+                batch.append(line)
+                if len(batch) >= batch_size:
+                    outfile.writelines(batch)
+                    batch = []
+            outfile.writelines(batch)
+    except FileNotFoundError:
+        logging.error(f"Input file not found: {input_file}")
+        raise
+    except json.JSONDecodeError:
+        logging.error(f"Invalid JSON format on line {line_number} of input file: {input_file}")
+        raise
+    except Exception as e:
+        logging.error(f"Error processing JSON Lines file: {e}")
+        raise
+
+
+CONVERSIONS = {
+    'text': ('json', 'jsonl', 'csv'),
+    'csv': ('json', 'jsonl'),
+    'json': ('jsonl', 'csv'),
+    'jsonl': ('json', 'csv'),
+}
+
+_JSON_CONSTANT_VALUES = {'NaN': float('nan'), 'Infinity': float('inf'), '-Infinity': float('-inf')}
+
+
+def _build_json_value(event, value, events):
+    """
+    Builds a Python value from parse events, consuming the events of one value.
+
+    Args:
+        event (str): The first event of the value.
+        value: Its event value.
+        events (iterator): The remaining JsonEventReader events.
+
+    Returns:
+        The value, as json.load would return it.
+    """
+    if event == 'start_map':
+        obj = {}
+        for event, key in events:
+            if event == 'end_map':
+                return obj
+            obj[key] = _build_json_value(*next(events), events)
+    if event == 'start_array':
+        items = []
+        for event, value in events:
+            if event == 'end_array':
+                return items
+            items.append(_build_json_value(event, value, events))
+    if event == 'number':
+        return json.loads(value)
+    if event == 'constant':
+        return _JSON_CONSTANT_VALUES[value]
+    return value
+
+
+def _iter_json_records(infile):
+    """
+    Streams the records of a JSON document: the elements of a top-level array
+    one at a time, or the whole document as a single record.
+
+    Yields:
+        tuple: The record's index in the top-level array (None for a whole
+               document) and the record.
+    """
+    events = iter(JsonEventReader(infile))
+    event, value = next(events)
+    if event != 'start_array':
+        yield None, _build_json_value(event, value, events)
+        return
+    for index, (event, value) in enumerate(events):
+        if event == 'end_array':
+            return
+        yield index, _build_json_value(event, value, events)
+
+
+def _iter_records(input_format, infile, replacer, column_rules=None, path_rules=None):
+    """
+    Reads and sanitizes the records of an input file for conversion.
+
+    Text lines become ``{"line_number", "text"}`` records, CSV rows become
+    records keyed by the header row, and JSON values are sanitized in place.
+
+    Raises:
+        ValueError: If the CSV header repeats a column name or a CSV row has
+                    more fields than the header.
+    """
+    if input_format == 'text':
+        for line_number, line in enumerate(infile, 1):
+            yield {'line_number': line_number, 'text': replacer.replace_patterns(line.rstrip('\r\n'))}
+    elif input_format == 'csv':
+        reader = csv.reader(infile)
+        header = next(reader, None)
+        if header is None:
+            return
+        duplicates = sorted({name for name in header if header.count(name) > 1})
+        if duplicates:
+            raise ValueError(f"CSV header repeats column(s) {', '.join(map(repr, duplicates))}; "
+                             f"records cannot be keyed by it")
+        if column_rules is not None:
+            sanitizer_for = _csv_column_sanitizers(header, replacer, column_rules)
+        for row in reader:
+            if len(row) > len(header):
+                raise ValueError(f"CSV row ending on line {reader.line_num} has {len(row) - len(header)} more "
+                                 f"field(s) than the header")
+            if column_rules is not None:
+                row = _sanitize_row(row, sanitizer_for)
+            else:
+                row = [replacer.replace_patterns(field) for field in row]
+            yield dict(zip(header, row))
+    elif input_format == 'json':
+        for index, record in _iter_json_records(infile):
+            state = None
+            if path_rules is not None and index is not None:
+                state = path_rules.step(path_rules.root(), index)
+            yield sanitize_json(record, replacer, path_rules, state)
+    else:
+        for line in infile:
+            if line.strip():
+                yield sanitize_json(json.loads(line), replacer, path_rules)
+
+
+def _flatten_record(record, prefix=''):
+    """
+    Flattens nested objects and arrays into dot-separated CSV columns.
+
+    Args:
+        record: A parsed JSON value.
+        prefix (str): The column name of the value.
+
+    Returns:
+        dict: Column names mapped to field text.
+
+    Raises:
+        ValueError: If two values flatten to the same column name, such as
+                    the keys ``"a.b"`` and ``"a": {"b": ...}``.
+    """
+    if isinstance(record, dict):
+        items = record.items()
+    elif isinstance(record, list):
+        items = enumerate(record)
+    else:
+        if record is None:
+            field = ''
+        elif isinstance(record, str):
+            field = record
+        else:
+            field = json.dumps(record)
+        return {prefix or 'value': field}
+    columns = {}
+    for key, value in items:
+        for name, field in _flatten_record(value, f"{prefix}.{key}" if prefix else str(key)).items():
+            if name in columns:
+                raise ValueError(f"More than one value flattens to the CSV column '{name}'")
+            columns[name] = field
+    return columns
+
+
+def _write_records(output_format, outfile, records, indent=4):
+    """
+    Writes converted records as JSON, JSON Lines or CSV, one record at a time.
+
+    The CSV header lists every column of every record, in order of first
+    appearance; fields a record lacks are left empty.
+    """
+    if output_format == 'jsonl':
+        for record in records:
+            outfile.write(json.dumps(record, separators=(',', ':')) + '\n')
+    elif output_format == 'json':
+        # Written element by element; matches json.dump of the whole list.
+        pad = ' ' * indent if indent is not None else None
+        written = False
+        outfile.write('[')
+        for record in records:
+            text = json.dumps(record, indent=indent)
+            if pad is None:
+                outfile.write((', ' if written else '') + text)
+            else:
+                outfile.write((',\n' if written else '\n') + pad + text.replace('\n', '\n' + pad))
+            written = True
+        outfile.write('\n]' if written and pad is not None else ']')
+    else:
+        # Records may add columns at any point, so rows are spooled to a
+        # temporary file until the header, every column seen, is known.
+        writer = csv.writer(outfile)
+        header = {}
+        with tempfile.TemporaryFile('w+', encoding='utf-8') as spool:
+            for record in records:
+                columns = _flatten_record(record)
+                for name in columns:
+                    header.setdefault(name)
+                spool.write(json.dumps(columns, separators=(',', ':')) + '\n')
+            if not header:
+                return
+            writer.writerow(header)
+            spool.seek(0)
+            for line in spool:
+                columns = json.loads(line)
+                writer.writerow([columns.get(name, '') for name in header])
+
+
+def convert_file(input_file, output_file, replacer, input_format, output_format, indent=4, column_rules=None,
+                 path_rules=None, compression_level=None):
+    """
+    Sanitizes a file and converts it to another format in a single streaming pass.
+
+    Args:
+        input_file (str): Path to the input file.
+        output_file (str): Path to the output file.
+        replacer (DataPatternReplacer): The DataPatternReplacer instance.
+        input_format (str): The format of the input file.
+        output_format (str): The format to write.
+        indent (int): The indent of JSON output, or None for single-line output.
+        column_rules (CsvColumnRules): Per-column rules for CSV input, or None.
+        path_rules (JsonPathRules): Key-path rules for JSON and JSON Lines input, or None.
+        compression_level (int): The output compression level, for compressed output.
+
+    Raises:
+        ValueError: If the conversion is not supported.
+    """
+    if output_format not in CONVERSIONS.get(input_format, ()):
+        raise ValueError(f"Cannot convert {input_format} input to {output_format} output.")
+    try:
+        with open_input(input_file, newline='' if input_format == 'csv' else None) as infile, \
+                open_output(output_file, newline='' if output_format == 'csv' else None,
+                            level=compression_level) as outfile:
+            _write_records(output_format, outfile, _iter_records(input_format, infile, replacer, column_rules,
+                                                                path_rules), indent)
+    except FileNotFoundError:
+        logging.error(f"Input file not found: {input_file}")
+        raise
+    except json.JSONDecodeError:
+        logging.error(f"Invalid JSON format in input file: {input_file}")
+        raise
+    except Exception as e:
+        logging.error(f"Error converting {input_format} file to {output_format}: {e}")
+        raise
+
+
+def replacer_options(args):
+    """
+    Collects the DataPatternReplacer keyword arguments from the command line.
+
+    Worker processes build their own replacers from the same options.
+
+    Args:
+        args (argparse.Namespace): The parsed arguments.
+
+    Returns:
+        dict: The keyword arguments.
+    """
+    return dict(use_faker=args.use_faker, faker_locale=args.faker_locale, engine=args.engine,
+                prefilter=not args.no_prefilter, regex_backend=args.regex_backend,
+                match_timeout=args.match_timeout, timeout_policy=args.timeout_policy,
+                timeout_mask=args.timeout_mask, faker_pool_size=args.faker_pool_size,
+                faker_pool_reuse=args.faker_pool_reuse, faker_pool_refill=args.faker_pool_refill,
+                faker_pool_workers=args.faker_pool_workers, pseudonym_cache_size=args.pseudonym_cache_size,
+                deterministic=args.deterministic_pseudonyms,
+                pseudonym_key=load_pseudonym_key(args.pseudonym_key_file),
+                pseudonym_store=args.pseudonym_store)
+
+
+def process_text_file(input_file, output_file, replacer, encoding=None, compression_level=None, byte_range=None):
+    """
+    Processes a text file line by line.
+
+    Args:
+        input_file (str): Path to the input text file.
+        output_file (str): Path to the output text file.
+        replacer (DataPatternReplacer): The DataPatternReplacer instance.
+        encoding (str): The file encoding (default: the locale's preferred encoding).
+        compression_level (int): The output compression level, for compressed output.
+        byte_range (tuple): The line-aligned start and end offsets of the part
+                            of the input to process, or None for all of it.
+    """
+    with open_input(input_file, encoding=encoding, byte_range=byte_range) as infile, \
+            open_output(output_file, encoding=encoding, level=compression_level) as outfile:
+        for line in infile:
+            sanitized_line = replacer.replace_patterns(line)
+            outfile.write(sanitized_line)
+
+
+def ascii_compatible(encoding):
+    """
+    Returns True if ASCII text, line breaks included, encodes to the same bytes.
+
+    Splitting such files at ``b'\\n'`` never cuts a character in two.
+    """
+    return '\n\\ aZ09'.encode(encoding) == b'\n\\ aZ09'
+
+
+class _DecodedMatch:
+    """
+    Presents a bytes match to replacement callables written for text matches.
+    """
+
+    __slots__ = ('_match', '_encoding')
+
+    def __init__(self, match, encoding):
+        self._match = match
+        self._encoding = encoding
+
+    def group(self, *indices):
+        groups = [None if value is None else value.decode(self._encoding)
+                  for value in (self._match.group(index) for index in (indices or (0,)))]
+        return groups[0] if len(groups) == 1 else tuple(groups)
+
+
+class BytePatternSet:
+    """
+    The patterns of a DataPatternReplacer compiled as bytes regexes.
+
+    Scanning follows the combined engine: the leftmost match wins, ties go to
+    the pattern defined first, and replacement text is never rescanned.
+    Patterns that can be embedded share one alternation; the others are
+    searched separately and merged with it, each stream only searched again
+    when a chosen match overlaps its next match.  Patterns are compiled with
+    MULTILINE so that ``^`` and ``$`` still match at every line; character
+    classes such as ``\\w`` and ``\\d`` only match ASCII.
+    """
+
+    def __init__(self, replacer, encoding):
+        """
+        Initializes the BytePatternSet.
+
+        Args:
+            replacer (DataPatternReplacer): The replacer whose patterns and
+                                            replacements are used.
+            encoding (str): The encoding of the scanned bytes, which must be
+                            ASCII-compatible.
+
+        Raises:
+            ValueError: If the encoding is not ASCII-compatible or a pattern
+                        cannot be compiled as a bytes regex.
+        """
+        if not ascii_compatible(encoding):
+            raise ValueError(f"encoding {encoding} is not ASCII-compatible")
+        self.encoding = encoding
+        self.regexes = []
+        self.replacements = []
+        for entry in replacer.compiled_patterns:
+            if isinstance(entry.regex, KeywordPattern):
+                raise ValueError(f"dictionary pattern '{entry.name}' cannot be scanned as bytes")
+            flags = (getattr(entry.regex, 'flags', 0) & _PORTABLE_FLAGS) | re.MULTILINE
+            try:
+                regex = re.compile(entry.regex.pattern.encode(encoding), flags)
+            except (re.error, UnicodeEncodeError) as e:
+                raise ValueError(f"pattern '{entry.name}' cannot be compiled as bytes: {e}") from None
+            self.regexes.append(regex)
+            self.replacements.append(self._replacement(regex, entry.repl))
+        self._build_streams()
+
+    def _replacement(self, regex, repl):
+        """
+        Returns the function computing the replacement bytes for a match of ``regex``.
+        """
+        encoding = self.encoding
+        if callable(repl):
+            return lambda match: repl(_DecodedMatch(match, encoding)).encode(encoding)
+        if '\\' in repl:
+            template = repl.encode(encoding)
+            # Re-run the pattern alone so the template sees its own groups.
+            return lambda match: regex.match(match.string, match.start()).expand(template)
+        literal = repl.encode(encoding)
+        return lambda match: literal
+
+    def _build_streams(self):
+        """
+        Builds the alternation of the embeddable patterns and lists the rest.
+
+        Each stream is a regex and a function mapping its match to the index
+        of the pattern that produced it.
+        """
+        base_flags = re.compile(b'', re.MULTILINE).flags
+        parts = []
+        groups = {}
+        group_names = set()
+        group_index = 1
+        self.streams = []
+        for position, regex in enumerate(self.regexes):
+            names = set(regex.groupindex)
+            if (regex.flags & ~base_flags or names & group_names
+                    or _UNCOMBINABLE_RE.search(regex.pattern.decode('latin-1'))):
+                self.streams.append((regex, lambda match, position=position: position))
+                continue
+            parts.append(b'(' + regex.pattern + b')')
+            group_names |= names
+            groups[group_index] = position
+            group_index += regex.groups + 1
+        if parts:
+            indices = sorted(groups)
+            try:
+                combined = re.compile(b'|'.join(parts), re.MULTILINE)
+            except re.error as e:
+                logging.warning(f"Could not build the combined bytes pattern ({e}); scanning patterns separately.")
+                self.streams = [(regex, lambda match, position=position: position)
+                                for position, regex in enumerate(self.regexes)]
+                return
+
+            def dispatch(match):
+                position = groups.get(match.lastindex)
+                if position is None:
+                    position = groups[indices[bisect_right(indices, match.lastindex) - 1]]
+                return position
+
+            self.streams.insert(0, (combined, dispatch))
+
+    def scan(self, buffer):
+        """
+        Finds the replacements in a buffer.
+
+        Args:
+            buffer: A bytes-like object, such as an mmap.
+
+        Yields:
+            tuple: The start and end offsets of each match and its replacement bytes.
+        """
+        replacements = self.replacements
+        if len(self.streams) == 1:
+            regex, dispatch = self.streams[0]
+            for match in regex.finditer(buffer):
+                yield match.start(), match.end(), replacements[dispatch(match)](match)
+            return
+
+        streams = self.streams
+        matches = [regex.search(buffer) for regex, _ in streams]
+        while True:
+            best = None
+            for index, match in enumerate(matches):
+                if match is None:
+                    continue
+                key = (match.start(), streams[index][1](match))
+                if best is None or key < best_key:
+                    best, best_key = index, key
+            if best is None:
+                return
+            match = matches[best]
+            start, end = match.span()
+            yield start, end, replacements[best_key[1]](match)
+            resume = end if end > start else end + 1
+            for index, other in enumerate(matches):
+                if other is not None and other.start() < resume:
+                    matches[index] = streams[index][0].search(buffer, resume)
+
+
+def _write_all(fd, buffers):
+    """
+    Writes a list of buffers to a file descriptor with as few system calls as possible.
+    """
+    if not hasattr(os, 'writev'):
+        os.write(fd, b''.join(buffers))
+        return
+    while buffers:
+        written = os.writev(fd, buffers)
+        # writev may write less than asked; drop what was written and retry.
+        while buffers and written >= len(buffers[0]):
+            written -= len(buffers[0])
+            buffers = buffers[1:]
+        if buffers and written:
+            buffers[0] = memoryview(buffers[0])[written:]
+
+
+def process_text_file_mmap(input_file, output_file, replacer, encoding=None, compression_level=None):
+    """
+    Processes a text file as bytes over a memory-mapped input.
+
+    Matches are found directly in the mapped file and the output is assembled
+    from slices of the unchanged regions plus the replacement bytes, written
+    in batches with ``os.writev``.  Unchanged regions shorter than
+    MMAP_SLICE_MIN are copied together with the replacements around them
+    instead, so that each write carries large buffers.  Nothing is decoded except the matched text
+    passed to Faker.  Unlike the line-by-line path, line endings are kept
+    exactly as they are, the combined engine's semantics apply whatever the
+    engine, and a pattern that can match a line break (such as ``\\s``) can
+    match across lines.  Match timeouts are not enforced.
+
+    Args:
+        input_file (str): Path to the input text file.
+        output_file (str): Path to the output text file.
+        replacer (DataPatternReplacer): The DataPatternReplacer instance.
+        encoding (str): The file encoding, which must be ASCII-compatible
+                        (default: the locale's preferred encoding).
+        compression_level (int): The output compression level, for compressed output.
+
+    Falls back to line-by-line processing, with a warning, when the patterns
+    cannot be scanned as bytes or either file is compressed.
+    """
+    if detect_compression(input_file) or detect_compression(output_file, reading=False):
+        logging.warning("Compressed files cannot be memory-mapped; processing line by line.")
+        process_text_file(input_file, output_file, replacer, encoding, compression_level)
+        return
+    try:
+        patterns = BytePatternSet(replacer, encoding or locale.getpreferredencoding(False))
+    except ValueError as e:
+        logging.warning(f"Cannot scan as bytes ({e}); processing line by line.")
+        process_text_file(input_file, output_file, replacer, encoding, compression_level)
+        return
+    if replacer._deadline is not None:
+        logging.warning("Match timeouts are not enforced when scanning as bytes.")
+    batch_size = min(os.sysconf('SC_IOV_MAX'), 1024) if hasattr(os, 'sysconf') else 1024
+    with open(input_file, 'rb') as infile, open(output_file, 'wb') as outfile:
+        if os.fstat(infile.fileno()).st_size == 0:
+            return
+        with mmap.mmap(infile.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+            view = memoryview(mapped)
+            try:
+                fd = outfile.fileno()
+                buffers = []
+                pending = bytearray()
+                position = 0
+                for start, end, replacement in patterns.scan(mapped):
+                    if start - position >= MMAP_SLICE_MIN:
+                        # Large unchanged regions go out as slices of the map.
+                        if pending:
+                            buffers.append(pending)
+                            pending = bytearray()
+                        buffers.append(view[position:start])
+                    else:
+                        pending += view[position:start]
+                    pending += replacement
+                    position = end
+                    if len(pending) >= MMAP_SLICE_MIN or len(buffers) >= batch_size - 2:
+                        buffers.append(pending)
+                        pending = bytearray()
+                        if len(buffers) >= batch_size - 2:
+                            _write_all(fd, buffers)
+                            buffers = []
+                buffers.append(pending)
+                buffers.append(view[position:])
+                _write_all(fd, buffers)
+            finally:
+                buffers = None
+                view.release()
+
+
+# The replacer of a worker process, built once by _init_worker, the column
+# sanitizers of a CSV worker and the key-path rules of a JSON Lines worker.
+_worker_replacer = None
+_worker_sanitizer_for = None
+_worker_path_rules = None
+
+
+def _init_worker(patterns, replacements, options):
+    """
+    Builds the DataPatternReplacer of a worker process.
+    """
+    global _worker_replacer
+    # Sibling workers use the pseudonym store at the same time.
+    _worker_replacer = DataPatternReplacer(patterns, replacements, pseudonym_store_shared=True, **options)
+    if _worker_replacer.faker is not None:
+        # Forked workers inherit the parent's random state; without a fresh
+        # seed they would all generate the same sequence of values.
+        _worker_replacer.faker.seed_instance(int.from_bytes(os.urandom(8), 'big'))
+    # Flush the pseudonym store and stop pool refills when the worker exits.
+    Finalize(None, _worker_replacer.close, exitpriority=10)
+
+
+def _sanitize_text_range(input_file, start, end, encoding):
+    """
+    Sanitizes the lines between two byte offsets of a text file in a worker.
+
+    Returns:
+        tuple: The sanitized text and the stats counted while producing it.
+    """
+    with open(input_file, 'rb') as infile:
+        infile.seek(start)
+        data = infile.read(end - start)
+    # Universal newlines, as when the file is read in text mode.
+    lines = io.StringIO(data.decode(encoding), newline=None)
+    sanitized = ''.join(_worker_replacer.replace_patterns(line) for line in lines)
+    stats = Counter(_worker_replacer.stats)
+    _worker_replacer.stats.clear()
+    return sanitized, stats
+
+
+def line_aligned_ranges(input_file, chunk_size, byte_range=None):
+    """
+    Splits a file into byte ranges of about ``chunk_size`` that end at line breaks.
+
+    Args:
+        input_file (str): Path to the file.
+        chunk_size (int): The target size of a range in bytes.
+        byte_range (tuple): The line-aligned start and end offsets of the part
+                            of the file to split, or None for all of it.
+
+    Yields:
+        tuple: The start and end offsets of each range.
+    """
+    start, size = byte_range or (0, os.path.getsize(input_file))
+    with open(input_file, 'rb') as infile:
+        while start < size:
+            end = start + chunk_size
+            if end < size:
+                infile.seek(end)
+                infile.readline()
+                end = infile.tell()
+            yield start, min(end, size)
+            start = end
+
+
+def process_text_file_parallel(input_file, output_file, replacer, workers, patterns, replacements, options,
+                               encoding=None, chunk_size=TEXT_CHUNK_SIZE, compression_level=None, byte_range=None):
+    """
+    Processes a text file on a pool of worker processes.
+
+    The file is split into line-aligned byte ranges that workers sanitize with
+    their own DataPatternReplacer.  Results are written in input order and at
+    most two ranges per worker are in flight, bounding memory use.  The stats
+    of the workers are merged into ``replacer``.  Pseudonym caches are per
+    worker; use deterministic pseudonyms or a pseudonym store, which workers
+    write through, for values that must be consistent across the whole file.
+
+    Args:
+        input_file (str): Path to the input text file.
+        output_file (str): Path to the output text file.
+        replacer (DataPatternReplacer): Receives the merged stats.
+        workers (int): The number of worker processes.
+        patterns (dict): The patterns, as passed to DataPatternReplacer.
+        replacements (dict): The replacements, as passed to DataPatternReplacer.
+        options (dict): The other DataPatternReplacer keyword arguments.
+        encoding (str): The file encoding, which must be ASCII-compatible
+                        (default: the locale's preferred encoding).
+        chunk_size (int): The target size of a range in bytes.
+        compression_level (int): The output compression level, for compressed output.
+        byte_range (tuple): The line-aligned start and end offsets of the part
+                            of the input to process, or None for all of it.
+    """
+    if detect_compression(input_file) and byte_range is None:
+        logging.warning("Compressed text input cannot be split between workers; processing it in one process.")
+        process_text_file(input_file, output_file, replacer, encoding, compression_level)
+        return
+    encoding = encoding or locale.getpreferredencoding(False)
+    if not ascii_compatible(encoding):
+        if byte_range is not None:
+            raise ValueError(f"encoding {encoding} is not ASCII-compatible and cannot be split into shards")
+        logging.warning(f"Encoding {encoding} is not ASCII-compatible and cannot be split between workers; "
+                        f"processing it in one process.")
+        process_text_file(input_file, output_file, replacer, encoding, compression_level)
+        return
+    with ProcessPoolExecutor(workers, initializer=_init_worker, initargs=(patterns, replacements, options)) as pool, \
+            open_output(output_file, encoding=encoding, level=compression_level) as outfile:
+        pending = deque()
+        for start, end in line_aligned_ranges(input_file, chunk_size, byte_range):
+            pending.append(pool.submit(_sanitize_text_range, input_file, start, end, encoding))
+            if len(pending) >= 2 * workers:
+                sanitized, stats = pending.popleft().result()
+                outfile.write(sanitized)
+                replacer.stats.update(stats)
+        while pending:
+            sanitized, stats = pending.popleft().result()
+            outfile.write(sanitized)
+            replacer.stats.update(stats)
+
+
+
+def _init_jsonl_worker(patterns, replacements, options, path_rules):
+    """
+    Builds the DataPatternReplacer and key-path rules of a JSON Lines worker process.
+    """
+    global _worker_path_rules
+    _init_worker(patterns, replacements, options)
+    _worker_path_rules = path_rules
+
+
+def _sanitize_jsonl_range(input_file, start, end, encoding):
+    """
+    Sanitizes the records between two byte offsets of a JSON Lines file in a worker.
+
+    Returns:
+        tuple: The sanitized lines, the stats counted while producing them,
+               the number of lines in the range and, if a line is not valid
+               JSON, its number within the range and the parser's message
+               (otherwise None).
+    """
+    with open(input_file, 'rb') as infile:
+        infile.seek(start)
+        data = infile.read(end - start)
+    sanitized = []
+    line_number = 0
+    error = None
+    for line_number, line in enumerate(io.StringIO(data.decode(encoding), newline=None), 1):
+        if line.strip():
+            try:
+                record = json.loads(line)
+            except json.JSONDecodeError as e:
+                error = (line_number, str(e))
+                break
+            line = json.dumps(sanitize_json(record, _worker_replacer, _worker_path_rules), separators=(',', ':')) + '\n'
+        sanitized.append(line)
+    stats = Counter(_worker_replacer.stats)
+    _worker_replacer.stats.clear()
+    return ''.join(sanitized), stats, line_number, error
+
+
+def process_jsonl_file_parallel(input_file, output_file, replacer, workers, patterns, replacements, options,
+                                path_rules=None, chunk_size=TEXT_CHUNK_SIZE, compression_level=None,
+                                byte_range=None):
+    """
+    Processes a JSON Lines file on a pool of worker processes.
+
+    Like process_text_file_parallel: the file is split into line-aligned
+    byte ranges, workers parse, sanitize and re-serialize their records, and
+    the results are written in input order with at most two ranges per
+    worker in flight.  The output is the same as that of process_jsonl_file.
+
+    Args:
+        input_file (str): Path to the input JSON Lines file.
+        output_file (str): Path to the output JSON Lines file.
+        replacer (DataPatternReplacer): Receives the merged stats.
+        workers (int): The number of worker processes.
+        patterns (dict): The patterns, as passed to DataPatternReplacer.
+        replacements (dict): The replacements, as passed to DataPatternReplacer.
+        options (dict): The other DataPatternReplacer keyword arguments.
+        path_rules (JsonPathRules): Key-path rules applied to each record, or None.
+        chunk_size (int): The target size of a range in bytes.
+        compression_level (int): The output compression level, for compressed output.
+        byte_range (tuple): The line-aligned start and end offsets of the part
+                            of the input to process, or None for all of it.
+
+    Raises:
+        ValueError: If a line is not valid JSON.
+    """
+    encoding = locale.getpreferredencoding(False)
+    if byte_range is None and (detect_compression(input_file) or not ascii_compatible(encoding)):
+        logging.warning("JSON Lines input that is compressed or not in an ASCII-compatible encoding cannot be "
+                        "split between workers; processing it in one process.")
+        process_jsonl_file(input_file, output_file, replacer, path_rules=path_rules,
+                           compression_level=compression_level)
+        return
+    lines_before = 0
+
+    def write(future):
+        nonlocal lines_before
+        sanitized, stats, lines, error = future.result()
+        replacer.stats.update(stats)
+        if error is not None:
+            line_number, message = error
+            logging.error(f"Invalid JSON format on line {lines_before + line_number} of input file: {input_file}")
+            raise ValueError(f"Invalid JSON on line {lines_before + line_number}: {message}")
+        outfile.write(sanitized)
+        lines_before += lines
+
+    with ProcessPoolExecutor(workers, initializer=_init_jsonl_worker,
+                             initargs=(patterns, replacements, options, path_rules)) as pool, \
+            open_output(output_file, level=compression_level) as outfile:
+        pending = deque()
+        for start, end in line_aligned_ranges(input_file, chunk_size, byte_range):
+            pending.append(pool.submit(_sanitize_jsonl_range, input_file, start, end, encoding))
+            if len(pending) >= 2 * workers:
+                write(pending.popleft())
+        while pending:
+            write(pending.popleft())
+
+def _init_csv_worker(patterns, replacements, options, header, column_rules):
+    """
+    Builds the DataPatternReplacer and column sanitizers of a CSV worker process.
+    """
+    global _worker_sanitizer_for
+    _init_worker(patterns, replacements, options)
+    _worker_sanitizer_for = None
+    if column_rules is not None:
+        _worker_sanitizer_for = _csv_column_sanitizers(header, _worker_replacer, column_rules, quiet=True)
+
+
+def _sanitize_csv_batch(rows):
+    """
+    Sanitizes a batch of CSV rows in a worker.
+
+    Returns:
+        tuple: The sanitized rows rendered as CSV text and the stats counted
+               while producing them.
+    """
+    output = io.StringIO()
+    writer = csv.writer(output)
+    for row in rows:
+        if _worker_sanitizer_for is not None:
+            writer.writerow(_sanitize_row(row, _worker_sanitizer_for))
+        else:
+            writer.writerow([_worker_replacer.replace_patterns(field) for field in row])
+    stats = Counter(_worker_replacer.stats)
+    _worker_replacer.stats.clear()
+    return output.getvalue(), stats
+
+
+def _read_csv_batches(reader, batches, batch_size, stop):
+    """
+    Parses CSV rows into batches on a background thread.
+
+    Puts lists of ``batch_size`` rows on the bounded ``batches`` queue, then
+    None; an exception raised while reading is put on the queue instead.
+    Gives up once ``stop`` is set.
+    """
+    def put(item):
+        while not stop.is_set():
+            try:
+                batches.put(item, timeout=0.1)
+                return
+            except queue.Full:
+                pass
+
+    try:
+        batch = []
+        for row in reader:
+            batch.append(row)
+            if len(batch) >= batch_size:
+                put(batch)
+                batch = []
+        if batch:
+            put(batch)
+        put(None)
+    except Exception as e:
+        put(e)
+
+
+def process_csv_file_parallel(input_file, output_file, replacer, workers, patterns, replacements, options,
+                              column_rules=None, batch_size=CSV_BATCH_ROWS, compression_level=None,
+                              byte_range=None):
+    """
+    Processes a CSV file on a pool of worker processes.
+
+    A reader thread parses rows, so quoted fields spanning several lines are
+    kept whole, and queues them in batches; workers sanitize the batches with
+    their own DataPatternReplacer and render them as CSV; the main thread
+    writes them in input order.  The reader queue and the in-flight batches
+    are both bounded by twice the number of workers, so memory use does not
+    grow with the file.  The stats of the workers are merged into ``replacer``.
+
+    Args:
+        input_file (str): Path to the input CSV file.
+        output_file (str): Path to the output CSV file.
+        replacer (DataPatternReplacer): Receives the merged stats.
+        workers (int): The number of worker processes.
+        patterns (dict): The patterns, as passed to DataPatternReplacer.
+        replacements (dict): The replacements, as passed to DataPatternReplacer.
+        options (dict): The other DataPatternReplacer keyword arguments.
+        column_rules (CsvColumnRules): Per-column rules, or None to sanitize every field.
+        batch_size (int): The number of rows per batch.
+        compression_level (int): The output compression level, for compressed output.
+        byte_range (tuple): The row-aligned start and end offsets of the part
+                            of the input to process, or None for all of it.
+    """
+    try:
+        with open_input(input_file, newline='', byte_range=byte_range) as infile, \
+                open_output(output_file, newline='', level=compression_level) as outfile:
+            reader = csv.reader(infile)
+            header = None
+            if column_rules is not None:
+                if byte_range is None or byte_range[0] == 0:
+                    header = next(reader, None)
+                    if header is None:
+                        return
+                    csv.writer(outfile).writerow(header)
+                else:
+                    header = _read_csv_header(input_file)
+                    if header is None:
+                        return
+                _csv_column_sanitizers(header, replacer, column_rules)
+
+            batches = queue.Queue(maxsize=2 * workers)
+            stop = threading.Event()
+            thread = threading.Thread(target=_read_csv_batches, args=(reader, batches, batch_size, stop),
+                                      daemon=True)
+            thread.start()
+            try:
+                with ProcessPoolExecutor(workers, initializer=_init_csv_worker,
+                                         initargs=(patterns, replacements, options, header, column_rules)) as pool:
+                    pending = deque()
+                    while True:
+                        batch = batches.get()
+                        if isinstance(batch, Exception):
+                            raise batch
+                        if batch is not None:
+                            pending.append(pool.submit(_sanitize_csv_batch, batch))
+                        while pending and (batch is None or len(pending) >= 2 * workers):
+                            text, stats = pending.popleft().result()
+                            outfile.write(text)
+                            replacer.stats.update(stats)
+                        if batch is None:
+                            break
+            finally:
+                stop.set()
+                thread.join()
+    except FileNotFoundError:
+        logging.error(f"Input file not found: {input_file}")
+        raise
+    except Exception as e:
+        logging.error(f"Error processing CSV file: {e}")
+        raise
+
+
+def infer_format(path):
     """
-    Identifies and replaces sensitive data patterns using regular expressions.
-    Supports configurable replacement strings and Faker for realistic anonymization.
+    Infers the format of a file from its extension, ignoring any compression
+    extension: .csv, .json, .jsonl or .ndjson, and text for anything else.
     """
+    root, extension = os.path.splitext(path.lower())
+    if extension in COMPRESSION_EXTENSIONS:
+        extension = os.path.splitext(root)[1]
+    return FORMAT_EXTENSIONS.get(extension, 'text')
 
-    def __init__(self, patterns=None, replacements=None, use_faker=False, faker_locale='en_US'):
-        """
-        Initializes the DataPatternReplacer.
 
-        Args:
-            patterns (dict): A dictionary of regular expression patterns to identify sensitive data.
-                             Keys are pattern names (e.g., "credit_card") and values are the regex strings.
-            replacements (dict): A dictionary of replacement strings for each pattern.
-                               Keys correspond to the pattern names in the 'patterns' dictionary,
-                               and values are the replacement strings.  If use_faker is True, this can
-                               contain Faker provider names.
-            use_faker (bool): Whether to use Faker to generate realistic replacement data.
-            faker_locale (str): The locale to use for Faker.
-        """
-        self.patterns = patterns or {}
-        self.replacements = replacements or {}
-        self.use_faker = use_faker
-        self.faker = Faker(faker_locale) if use_faker else None
+def parse_shard(value):
+    """
+    Parses a shard given as ``i/N`` on the command line.
 
-    def replace_patterns(self, data):
-        """
-        Replaces sensitive data patterns in the input data.
+    Returns:
+        tuple: The zero-based shard index and the number of shards.
 
-        Args:
-            data (str): The input data to sanitize.
+    Raises:
+        argparse.ArgumentTypeError: If the value is not a valid shard.
+    """
+    match = re.fullmatch(r'(\d+)/(\d+)', value.strip())
+    if match is None or not int(match.group(1)) < int(match.group(2)):
+        raise argparse.ArgumentTypeError(f"expected i/N with 0 <= i < N, got '{value}'")
+    return int(match.group(1)), int(match.group(2))
 
-        Returns:
-            str: The sanitized data.
-        """
-        try:
-            for pattern_name, pattern in self.patterns.items():
-                replacement = self.replacements.get(pattern_name)
-                if replacement is None:
-                    logging.warning(f"No replacement found for pattern: {pattern_name}. Skipping.")
-                    continue
 
-                if self.use_faker:
-                    # Use Faker provider if specified in replacement string
-                    if hasattr(self.faker, replacement):
-                        data = re.sub(pattern, lambda x: str(getattr(self.faker, replacement)()), data)
-                    else:
-                        logging.warning(f"Faker provider '{replacement}' not found. Using default replacement string.")
-                        data = re.sub(pattern, replacement, data)
-                else:
-                    data = re.sub(pattern, replacement, data)
+def _line_start(infile, offset):
+    """
+    Returns the first offset at or after ``offset`` where a line starts.
+    """
+    if offset == 0:
+        return 0
+    infile.seek(offset - 1)
+    infile.readline()
+    return infile.tell()
 
-            return data
+
+def _csv_row_start(infile, offset):
+    """
+    Returns the first offset at or after ``offset`` where a CSV row starts.
+
+    A line break ends a row when an even number of quote characters precede
+    it, so the quotes before ``offset`` are counted from the start of the file.
+    """
+    if offset == 0:
+        return 0
+    quotes = 0
+    remaining = offset - 1
+    while remaining:
+        chunk = infile.read(min(remaining, SHARD_SCAN_SIZE))
+        if not chunk:
+            return infile.tell()
+        quotes += chunk.count(b'"')
+        remaining -= len(chunk)
+    position = offset - 1
+    while True:
+        chunk = infile.read(SHARD_SCAN_SIZE)
+        if not chunk:
+            return position
+        start = 0
+        while True:
+            newline = chunk.find(b'\n', start)
+            if newline < 0:
+                quotes += chunk.count(b'"', start)
+                break
+            quotes += chunk.count(b'"', start, newline)
+            if quotes % 2 == 0:
+                return position + newline + 1
+            start = newline + 1
+        position += len(chunk)
+
+
+def shard_range(input_file, index, count, input_format):
+    """
+    Computes the byte range of a file processed by one of ``count`` shards.
+
+    The file is cut into ``count`` parts of about equal size, each boundary
+    moved forward to the next line, or for CSV the next row, so every shard
+    computes the same boundaries independently and together they cover the
+    file exactly once.  Aligning a CSV boundary scans the file up to it for
+    quotes, so quotes must only enclose fields, as the CSV standard requires.
+
+    Args:
+        input_file (str): Path to the input file.
+        index (int): The zero-based index of the shard.
+        count (int): The number of shards.
+        input_format (str): The format of the input file.
+
+    Returns:
+        tuple: The start and end offsets of the shard.
+
+    Raises:
+        ValueError: If the format cannot be sharded or the file is compressed.
+    """
+    if input_format not in SHARD_FORMATS:
+        raise ValueError(f"{input_format} input cannot be split into shards")
+    if detect_compression(input_file):
+        raise ValueError(f"{input_file} is compressed and cannot be split into shards")
+    size = os.path.getsize(input_file)
+    align = _csv_row_start if input_format == 'csv' else _line_start
+    offsets = []
+    for boundary in (index, index + 1):
+        offset = size * boundary // count
+        if offset >= size:
+            offsets.append(size)
+            continue
+        with open(input_file, 'rb') as infile:
+            offsets.append(min(align(infile, offset), size))
+    return tuple(offsets)
+
+
+def merge_shards(shard_files, output_file):
+    """
+    Concatenates the outputs of the shards of a job, in order.
+
+    Shards after the first are written without a CSV header, and compressed
+    shards are whole compressed streams, so concatenating them gives the
+    output of an unsharded run.
+
+    Args:
+        shard_files (list): Paths to the shard outputs, in shard order.
+        output_file (str): Path to the merged output.
+
+    Raises:
+        ValueError: If the output is also one of the shards.
+    """
+    output_path = os.path.abspath(output_file)
+    if any(os.path.abspath(path) == output_path for path in shard_files):
+        raise ValueError(f"{output_file} is one of the shards being merged")
+    for path in shard_files:
+        if not os.path.isfile(path):
+            raise FileNotFoundError(f"Shard output not found: {path}")
+    with open(output_file, 'wb') as outfile:
+        for path in shard_files:
+            with open(path, 'rb') as infile:
+                shutil.copyfileobj(infile, outfile, SHARD_SCAN_SIZE)
+    logging.info(f"Merged {len(shard_files)} shards into {output_file} ({os.path.getsize(output_file)} bytes).")
+
+
+def process_file(input_file, output_file, replacer, input_format, output_format, args, column_rules=None,
+                 path_rules=None, pool_args=None):
+    """
+    Sanitizes one file, converting it if the output format differs.
+
+    Args:
+        input_file (str): Path to the input file.
+        output_file (str): Path to the output file.
+        replacer (DataPatternReplacer): The DataPatternReplacer instance.
+        input_format (str): The format of the input file.
+        output_format (str): The format to write.
+        args (argparse.Namespace): The parsed command line, for the processing options.
+        column_rules (CsvColumnRules): Per-column rules for CSV input, or None.
+        path_rules (JsonPathRules): Key-path rules for JSON and JSON Lines input, or None.
+        pool_args (tuple): The patterns, replacements and replacer options that
+                           worker processes are built from, or None to stay in
+                           this process whatever ``args.workers`` says.
+
+    Raises:
+        ValueError: If the conversion is not supported, or a checkpoint is
+                    requested for a format or conversion without one.
+    """
+    workers = args.workers if pool_args is not None else 1
+    indent = None if args.compact_json else 4
+    level = args.compression_level
+    if input_format != 'csv':
+        column_rules = None
+    if input_format not in ('json', 'jsonl'):
+        path_rules = None
+    if args.checkpoint and (input_format not in ('text', 'csv') or output_format != input_format):
+        raise ValueError("--checkpoint only applies to text and CSV files written in the same format")
+    byte_range = None
+    if args.shard:
+        if output_format != input_format:
+            raise ValueError("--shard cannot be combined with a format conversion")
+        if input_format == 'text' and not ascii_compatible(args.encoding or locale.getpreferredencoding(False)):
+            raise ValueError(f"encoding {args.encoding} is not ASCII-compatible and cannot be split into shards")
+        byte_range = shard_range(input_file, *args.shard, input_format)
+        logging.info(f"Processing shard {args.shard[0]}/{args.shard[1]}: bytes {byte_range[0]}-{byte_range[1]}.")
+
+    if output_format != input_format:
+        convert_file(input_file, output_file, replacer, input_format, output_format, indent, column_rules,
+                     path_rules, level)
+
+    elif input_format == 'text':
+        try:
+            if args.checkpoint:
+                process_text_file_checkpointed(input_file, output_file, replacer,
+                                               _run_checkpoint(input_file, output_file, args, pool_args),
+                                               args.encoding)
+            elif args.binary:
+                process_text_file_mmap(input_file, output_file, replacer, args.encoding, level)
+            elif workers > 1:
+                process_text_file_parallel(input_file, output_file, replacer, workers, *pool_args, args.encoding,
+                                           compression_level=level, byte_range=byte_range)
+            else:
+                process_text_file(input_file, output_file, replacer, args.encoding, level, byte_range)
+        except FileNotFoundError:
+            logging.error(f"Input file not found: {input_file}")
+            raise
         except Exception as e:
-            logging.error(f"Error during pattern replacement: {e}")
+            logging.error(f"Error processing text file: {e}")
             raise
 
-def setup_argparse():
+    elif input_format == 'csv':
+        if args.checkpoint:
+            process_csv_file_checkpointed(input_file, output_file, replacer,
+                                          _run_checkpoint(input_file, output_file, args, pool_args), column_rules)
+        elif workers > 1:
+            process_csv_file_parallel(input_file, output_file, replacer, workers, *pool_args, column_rules,
+                                      compression_level=level, byte_range=byte_range)
+        else:
+            process_csv_file(input_file, output_file, replacer, column_rules, level, byte_range)
+
+    elif input_format == 'json':
+        process_json_file(input_file, output_file, replacer, args.stream_json, indent, path_rules, level)
+
+    elif input_format == 'jsonl':
+        if workers > 1:
+            process_jsonl_file_parallel(input_file, output_file, replacer, workers, *pool_args, path_rules,
+                                        compression_level=level, byte_range=byte_range)
+        else:
+            process_jsonl_file(input_file, output_file, replacer, path_rules=path_rules, compression_level=level,
+                               byte_range=byte_range)
+    else:
+        raise ValueError(f"Invalid input format: {input_format}")
+
+
+def _run_checkpoint(input_file, output_file, args, pool_args):
     """
-    Sets up the argparse command-line interface.
+    Builds the Checkpoint of a single-file run from the command line.
+    """
+    fingerprint = run_fingerprint(args, pool_args[0] if pool_args else {})
+    return Checkpoint(args.checkpoint, input_file, output_file, fingerprint, args.checkpoint_interval)
+
+
+def collect_batch_inputs(spec, exclude=None):
+    """
+    Lists the files of a batch.
+
+    Args:
+        spec (str): A directory, walked recursively, or a glob pattern
+                    (``**`` matches any number of directories).
+        exclude (str): A directory whose files are left out, such as the output root.
 
     Returns:
-        argparse.ArgumentParser: The argument parser.
+        tuple: The directory the input tree is mirrored from and the list of file paths.
     """
-    parser = argparse.ArgumentParser(description='Sanitize data by replacing sensitive patterns.')
-    parser.add_argument('input_file', type=str, help='Path to the input file.')
-    parser.add_argument('output_file', type=str, help='Path to the output file.')
-    parser.add_argument('--patterns_file', type=str, help='Path to the JSON file containing regex patterns and replacements.', required=True)
-    parser.add_argument('--use_faker', action='store_true', help='Use Faker to generate realistic replacement data.')
-    parser.add_argument('--faker_locale', type=str, default='en_US', help='Locale to use for Faker (default: en_US).')
-    parser.add_argument('--input_format', type=str, choices=['text', 'json', 'csv'], default='text', help='Format of the input file (default: text).')
-    parser.add_argument('--output_format', type=str, choices=['text', 'json', 'csv'], default='text', help='Format of the output file (default: text).')
+    if os.path.isdir(spec):
+        base = spec
+        files = [os.path.join(directory, name) for directory, _, names in os.walk(spec) for name in names]
+    else:
+        parts = spec.split(os.sep)
+        fixed = next(index for index, part in enumerate(parts) if _GLOB_MAGIC.search(part))
+        base = os.sep.join(parts[:fixed]) or os.curdir
+        files = [path for path in glob.glob(spec, recursive=True) if os.path.isfile(path)]
+    if exclude is not None:
+        exclude = os.path.abspath(exclude)
+        files = [path for path in files if os.path.commonpath([exclude, os.path.abspath(path)]) != exclude]
+    return base, files
 
-    return parser
+
+def _batch_output_path(output_root, relative_path, input_format, output_format):
+    """
+    Maps an input file to its path under the output root, replacing the
+    format extension when the file is converted.
+    """
+    path = os.path.join(output_root, relative_path)
+    if output_format == input_format:
+        return path
+    root, compression = os.path.splitext(path)
+    if compression.lower() not in COMPRESSION_EXTENSIONS:
+        root, compression = path, ''
+    stem, extension = os.path.splitext(root)
+    if extension.lower() in FORMAT_EXTENSIONS:
+        root = stem
+    return f"{root}.{'txt' if output_format == 'text' else output_format}{compression}"
 
 
-def load_patterns_from_json(patterns_file):
+def _process_batch_file(input_file, output_file, input_format, output_format, args, column_rules, path_rules,
+                        replacer=None):
     """
-    Loads patterns and replacements from a JSON file.
+    Sanitizes one file of a batch, by default with the worker's replacer.
+
+    Returns:
+        dict: The file's result: its paths, status, error, sizes, time and the
+              stats counted while processing it.
+    """
+    replacer = replacer or _worker_replacer
+    info = os.stat(input_file)
+    result = {'input': input_file, 'output': output_file, 'format': input_format, 'status': 'ok', 'error': None,
+              'input_bytes': info.st_size, 'mtime_ns': info.st_mtime_ns, 'output_bytes': None}
+    started = time.perf_counter()
+    before = Counter(replacer.stats)
+    try:
+        os.makedirs(os.path.dirname(output_file) or os.curdir, exist_ok=True)
+        process_file(input_file, output_file, replacer, input_format, output_format, args, column_rules,
+                     path_rules)
+        result['output_bytes'] = os.path.getsize(output_file)
+        if args.incremental:
+            result['sha256'] = file_sha256(input_file)
+    except Exception as e:
+        result['status'] = 'error'
+        result['error'] = str(e)
+    result['seconds'] = round(time.perf_counter() - started, 3)
+    stats = Counter(replacer.stats)
+    stats.subtract(before)
+    result['stats'] = +stats
+    if replacer is _worker_replacer:
+        replacer.stats.clear()
+    return result
+
+
+def process_batch(spec, output_root, replacer, args, column_rules=None, path_rules=None, pool_args=None):
+    """
+    Sanitizes every file of a directory tree or glob into a mirrored tree.
+
+    Files are scheduled largest first so that one large file does not finish
+    last.  With more than one worker, each worker process builds its
+    DataPatternReplacer once and reuses it for all its files; otherwise
+    ``replacer`` processes them in turn.  A file that fails is reported and
+    the batch carries on.  With ``args.incremental``, files recorded in the
+    manifest as unchanged since they were last sanitized under the same
+    patterns, options and version are skipped.
 
     Args:
-        patterns_file (str): Path to the JSON file.
+        spec (str): An input directory or glob pattern.
+        output_root (str): The directory the tree is mirrored into.
+        replacer (DataPatternReplacer): Processes the files without workers
+                                        and receives the merged stats.
+        args (argparse.Namespace): The parsed command line, for the processing options.
+        column_rules (CsvColumnRules): Per-column rules for CSV files, or None.
+        path_rules (JsonPathRules): Key-path rules for JSON and JSON Lines files, or None.
+        pool_args (tuple): The patterns, replacements and replacer options that
+                           worker processes are built from.
 
     Returns:
-        tuple: A tuple containing patterns (dict) and replacements (dict).
+        list: The per-file results, in completion order.
+
+    Raises:
+        FileNotFoundError: If no files match ``spec``.
     """
+    base, files = collect_batch_inputs(spec, exclude=output_root)
+    if not files:
+        raise FileNotFoundError(f"No input files match {spec}")
+    files.sort(key=os.path.getsize, reverse=True)
+    manifest = None
+    if args.incremental:
+        manifest_path = os.path.join(output_root, MANIFEST_NAME)
+        manifest = load_manifest(manifest_path, run_fingerprint(args, pool_args[0] if pool_args else {}))
+    tasks = []
+    results = []
+    for path in files:
+        input_format = infer_format(path) if args.input_format == 'auto' else args.input_format
+        output_format = args.output_format or input_format
+        relative_path = os.path.relpath(path, base)
+        output_file = _batch_output_path(output_root, relative_path, input_format, output_format)
+        if manifest is not None and _unchanged(manifest['files'].get(relative_path), path, output_file):
+            results.append({'input': path, 'output': output_file, 'format': input_format, 'status': 'skipped'})
+            continue
+        tasks.append((path, output_file, input_format, output_format, args, column_rules, path_rules))
+    logging.info(f"Batch of {len(tasks)} files from {base} into {output_root}"
+                 + (f"; {len(results)} unchanged files skipped." if results else "."))
+
+    def record(result):
+        results.append(result)
+        if manifest is None:
+            return
+        entry_key = os.path.relpath(result['input'], base)
+        if result['status'] == 'ok':
+            manifest['files'][entry_key] = {'size': result['input_bytes'], 'mtime_ns': result['mtime_ns'],
+                                            'sha256': result['sha256'], 'output': result['output']}
+        else:
+            manifest['files'].pop(entry_key, None)
+        if len(results) % MANIFEST_SAVE_INTERVAL == 0:
+            save_manifest(manifest_path, manifest)
+
     try:
-        with open(patterns_file, 'r') as f:
-            data = json.load(f)
-            patterns = data.get('patterns', {})
-            replacements = data.get('replacements', {})
-            return patterns, replacements
+        if args.workers > 1 and pool_args is not None:
+            with ProcessPoolExecutor(args.workers, initializer=_init_worker, initargs=pool_args) as pool:
+                futures = [pool.submit(_process_batch_file, *task) for task in tasks]
+                for future in as_completed(futures):
+                    record(_report_batch_file(future.result(), replacer))
+        else:
+            for task in tasks:
+                record(_report_batch_file(_process_batch_file(*task, replacer=replacer), None))
+    finally:
+        if manifest is not None:
+            present = {os.path.relpath(path, base) for path in files}
+            manifest['files'] = {key: entry for key, entry in manifest['files'].items() if key in present}
+            save_manifest(manifest_path, manifest)
+
+    if args.report:
+        with open(args.report, 'w') as f:
+            json.dump(results, f, indent=4)
+    return results
+
+
+def file_sha256(path):
+    """
+    Returns the hex SHA-256 of a file's contents.
+    """
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1 << 20), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def run_fingerprint(args, patterns):
+    """
+    Identifies everything besides the input that decides a batch's output.
+
+    Args:
+        args (argparse.Namespace): The parsed command line.
+        patterns (dict): The loaded patterns, whose dictionary term files are
+                         hashed along with the patterns file.
+
+    Returns:
+        dict: The tool version, a hash of the patterns file and its term files,
+              and a hash of the options that change the output.
+    """
+    rules = hashlib.sha256()
+    with open(args.patterns_file, 'rb') as f:
+        rules.update(f.read())
+    for spec in patterns.values():
+        if isinstance(spec, dict) and spec.get('terms_file'):
+            rules.update(file_sha256(spec['terms_file']).encode('ascii'))
+    options = {name: getattr(args, name) for name in OUTPUT_OPTIONS}
+    # Per-pattern deterministic replacements use the key even without
+    # --deterministic_pseudonyms, so any configured key is part of the run.
+    key = load_pseudonym_key(args.pseudonym_key_file)
+    if key:
+        # Identifies the key without revealing it.
+        key = key.encode('utf-8') if isinstance(key, str) else key
+        options['pseudonym_key'] = hmac.new(key, b'datascan-manifest', hashlib.sha256).hexdigest()
+    options_hash = hashlib.sha256(json.dumps(options, sort_keys=True).encode('utf-8')).hexdigest()
+    return {'version': __version__, 'patterns_sha256': rules.hexdigest(), 'options_sha256': options_hash}
+
+
+def load_manifest(path, fingerprint):
+    """
+    Loads the manifest of an incremental batch.
+
+    A missing or unreadable manifest, or one written by another version or
+    under other patterns or options, yields an empty manifest, so that every
+    file is sanitized again.
+
+    Args:
+        path (str): Path to the manifest.
+        fingerprint (dict): The run's fingerprint, from run_fingerprint.
+
+    Returns:
+        dict: The fingerprint plus a "files" mapping of relative input paths to
+              their size, mtime, SHA-256 and output path.
+    """
+    try:
+        with open(path, 'r') as f:
+            manifest = json.load(f)
     except FileNotFoundError:
-        logging.error(f"Patterns file not found: {patterns_file}")
-        raise
-    except json.JSONDecodeError:
-        logging.error(f"Invalid JSON format in patterns file: {patterns_file}")
-        raise
-    except Exception as e:
-        logging.error(f"Error loading patterns from JSON: {e}")
-        raise
+        manifest = None
+    except (OSError, ValueError) as e:
+        logging.warning(f"Ignoring unreadable manifest {path}: {e}")
+        manifest = None
+    if manifest is not None and all(manifest.get(key) == value for key, value in fingerprint.items()):
+        return manifest
+    if manifest is not None:
+        logging.info("Patterns, options or version changed since the last run; sanitizing every file.")
+    return dict(fingerprint, files={})
 
-def process_csv_file(input_file, output_file, replacer):
+
+def save_manifest(path, manifest):
     """
-    Processes a CSV file, sanitizing each field.
+    Writes the manifest atomically.
+    """
+    os.makedirs(os.path.dirname(path) or os.curdir, exist_ok=True)
+    temporary = path + '.tmp'
+    with open(temporary, 'w') as f:
+        json.dump(manifest, f, indent=1)
+    os.replace(temporary, path)
+
+
+def _unchanged(entry, input_file, output_file):
+    """
+    Decides from its manifest entry whether a file can be skipped.
+
+    The size and mtime are checked first; the contents are only hashed when
+    the size matches but the mtime does not, and a match updates the mtime.
+    """
+    if entry is None or entry.get('output') != output_file or not os.path.exists(output_file):
+        return False
+    info = os.stat(input_file)
+    if info.st_size != entry['size']:
+        return False
+    if info.st_mtime_ns == entry['mtime_ns']:
+        return True
+    if file_sha256(input_file) != entry['sha256']:
+        return False
+    entry['mtime_ns'] = info.st_mtime_ns
+    return True
+
+
+def _report_batch_file(result, replacer):
+    """
+    Logs the result of one batch file and merges its stats into ``replacer``.
+    """
+    if replacer is not None:
+        replacer.stats.update(result['stats'])
+    if result['status'] == 'ok':
+        logging.info(f"{result['input']} -> {result['output']}: ok in {result['seconds']}s "
+                     f"({result['input_bytes']} -> {result['output_bytes']} bytes)")
+    else:
+        logging.error(f"{result['input']}: {result['error']}")
+    result['stats'] = dict(result['stats'])
+    return result
+
+
+class Checkpoint:
+    """
+    Periodic checkpoints of a single-file run, for resuming after an interruption.
+
+    A checkpoint records the input and output offsets reached, the replacer's
+    state and what the run depends on: the input's size and mtime, the output
+    path and the run fingerprint.  It is written atomically and readable by
+    the owner only, since the pseudonym cache it holds contains original
+    values.  A checkpoint that does not match the run is refused rather than
+    silently ignored.
+    """
+
+    def __init__(self, path, input_file, output_file, fingerprint, interval=60):
+        """
+        Initializes the Checkpoint.
+
+        Args:
+            path (str): Path to the checkpoint file.
+            input_file (str): Path to the input file.
+            output_file (str): Path to the output file.
+            fingerprint (dict): The run fingerprint, from run_fingerprint.
+            interval (float): The minimum number of seconds between checkpoints.
+        """
+        self.path = path
+        self.interval = interval
+        info = os.stat(input_file)
+        self.identity = {'input': os.path.abspath(input_file), 'input_size': info.st_size,
+                         'input_mtime_ns': info.st_mtime_ns, 'output': os.path.abspath(output_file),
+                         'fingerprint': fingerprint}
+        self._last = time.monotonic()
+
+    def load(self):
+        """
+        Loads the checkpoint left by an interrupted run.
+
+        Returns:
+            dict: The checkpoint, or None if there is none.
+
+        Raises:
+            ValueError: If the checkpoint was written for another input, output,
+                        patterns file or set of options.
+        """
+        try:
+            with open(self.path, 'r') as f:
+                data = json.load(f)
+        except FileNotFoundError:
+            return None
+        mismatched = [key for key, value in self.identity.items() if data.get(key) != value]
+        if mismatched:
+            raise ValueError(f"Checkpoint {self.path} does not match this run ({', '.join(mismatched)} changed); "
+                             f"delete it to start over.")
+        logging.info(f"Resuming from checkpoint at input offset {data['input_offset']}.")
+        return data
+
+    def due(self):
+        """
+        Returns True if the interval since the last checkpoint has passed.
+        """
+        return time.monotonic() - self._last >= self.interval
+
+    def save(self, infile, outfile, replacer):
+        """
+        Flushes the output to disk and records the positions reached.
+
+        Args:
+            infile (file): The input, positioned after the last processed record.
+            outfile (file): The output, positioned after its sanitized version.
+            replacer (DataPatternReplacer): The replacer whose state is saved.
+        """
+        outfile.flush()
+        os.fsync(outfile.fileno())
+        data = dict(self.identity, input_offset=infile.tell(), output_offset=outfile.tell(),
+                    replacer=replacer.checkpoint())
+        temporary = self.path + '.tmp'
+        fd = os.open(temporary, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+        with os.fdopen(fd, 'w') as f:
+            json.dump(data, f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(temporary, self.path)
+        directory = os.open(os.path.dirname(os.path.abspath(self.path)), os.O_RDONLY)
+        try:
+            os.fsync(directory)
+        finally:
+            os.close(directory)
+        # Only now may the store receive the mappings the checkpoint records.
+        replacer.commit_store_writes()
+        self._last = time.monotonic()
+
+    def remove(self):
+        """
+        Deletes the checkpoint once the run has completed.
+        """
+        try:
+            os.remove(self.path)
+        except FileNotFoundError:
+            pass
+
+
+def _open_checkpointed(input_file, output_file, replacer, checkpoint, newline=None, encoding=None):
+    """
+    Opens the input and output of a checkpointed run, positioned to resume.
+
+    Returns:
+        tuple: The input file, the output file and the checkpoint data (None for a fresh run).
+
+    Raises:
+        ValueError: If either file is compressed.
+    """
+    if detect_compression(input_file) or detect_compression(output_file, reading=False):
+        raise ValueError("checkpoints need uncompressed input and output")
+    data = checkpoint.load()
+    replacer.hold_store_writes()
+    infile = open(input_file, 'r', newline=newline, encoding=encoding)
+    outfile = open(output_file, 'r+' if data is not None else 'w', newline=newline, encoding=encoding)
+    if data is not None:
+        infile.seek(data['input_offset'])
+        outfile.seek(data['output_offset'])
+        outfile.truncate()
+        replacer.restore(data['replacer'])
+    return infile, outfile, data
+
+
+def process_text_file_checkpointed(input_file, output_file, replacer, checkpoint, encoding=None):
+    """
+    Processes a text file line by line, checkpointing periodically.
+
+    If the checkpoint holds the state of an interrupted run, processing resumes
+    where it was last saved, and the output is the same as that of an
+    uninterrupted run.
 
     Args:
-        input_file (str): Path to the input CSV file.
-        output_file (str): Path to the output CSV file.
+        input_file (str): Path to the input text file.
+        output_file (str): Path to the output text file.
         replacer (DataPatternReplacer): The DataPatternReplacer instance.
+        checkpoint (Checkpoint): The checkpoint.
+        encoding (str): The file encoding (default: the locale's preferred encoding).
     """
+    infile, outfile, _ = _open_checkpointed(input_file, output_file, replacer, checkpoint, encoding=encoding)
     try:
-        with open(input_file, 'r', newline='') as infile, open(output_file, 'w', newline='') as outfile:
-            reader = csv.reader(infile)
-            writer = csv.writer(outfile)
-            for row in reader:
-                sanitized_row = [replacer.replace_patterns(field) for field in row]
-                writer.writerow(sanitized_row)
-    except FileNotFoundError:
-        logging.error(f"Input file not found: {input_file}")
-        raise
-    except Exception as e:
-        logging.error(f"Error processing CSV file: {e}")
+        with infile, outfile:
+            # readline() rather than iteration, which would disable tell().
+            for count, line in enumerate(iter(infile.readline, ''), 1):
+                outfile.write(replacer.replace_patterns(line))
+                if count % CHECKPOINT_CHECK_RECORDS == 0 and checkpoint.due():
+                    checkpoint.save(infile, outfile, replacer)
+    except BaseException:
+        replacer.discard_store_writes()
         raise
+    checkpoint.remove()
+
 
-def process_json_file(input_file, output_file, replacer):
+def process_csv_file_checkpointed(input_file, output_file, replacer, checkpoint, column_rules=None):
     """
-    Processes a JSON file, sanitizing string values.
+    Processes a CSV file row by row, checkpointing periodically.
 
     Args:
-        input_file (str): Path to the input JSON file.
-        output_file (str): Path to the output JSON file.
+        input_file (str): Path to the input CSV file.
+        output_file (str): Path to the output CSV file.
         replacer (DataPatternReplacer): The DataPatternReplacer instance.
+        checkpoint (Checkpoint): The checkpoint.
+        column_rules (CsvColumnRules): Per-column rules, or None to sanitize every field.
     """
+    infile, outfile, data = _open_checkpointed(input_file, output_file, replacer, checkpoint, newline='')
     try:
-        with open(input_file, 'r') as infile, open(output_file, 'w') as outfile:
-            data = json.load(infile)
-            def sanitize_json(obj):
-                if isinstance(obj, str):
-                    return replacer.replace_patterns(obj)
-                elif isinstance(obj, dict):
-                    return {k: sanitize_json(v) for k, v in obj.items()}
-                elif isinstance(obj, list):
-                    return [sanitize_json(elem) for elem in obj]
+        with infile, outfile:
+            # The reader pulls exactly the lines of each row, so tell() is at a row boundary.
+            reader = csv.reader(iter(infile.readline, ''))
+            writer = csv.writer(outfile)
+            sanitizer_for = None
+            if column_rules is not None:
+                if data is not None:
+                    position = infile.tell()
+                    infile.seek(0)
+                    header = next(csv.reader(iter(infile.readline, '')), None)
+                    infile.seek(position)
                 else:
-                    return obj
-
-            sanitized_data = sanitize_json(data)
-            json.dump(sanitized_data, outfile, indent=4)  # Add indent for readability
-    except FileNotFoundError:
-        logging.error(f"Input file not found: {input_file}")
-        raise
-    except json.JSONDecodeError:
-        logging.error(f"Invalid JSON format in input file: {input_file}")
-        raise
-    except Exception as e:
-        logging.error(f"Error processing JSON file: {e}")
+                    header = next(reader, None)
+                    if header is not None:
+                        writer.writerow(header)
+                if header is not None:
+                    sanitizer_for = _csv_column_sanitizers(header, replacer, column_rules)
+            for count, row in enumerate(reader, 1):
+                if sanitizer_for is not None:
+                    writer.writerow(_sanitize_row(row, sanitizer_for))
+                else:
+                    writer.writerow([replacer.replace_patterns(field) for field in row])
+                if count % CHECKPOINT_CHECK_RECORDS == 0 and checkpoint.due():
+                    checkpoint.save(infile, outfile, replacer)
+    except BaseException:
+        replacer.discard_store_writes()
         raise
+    checkpoint.remove()
 
 
 def main():
     """
     Main function to execute the data sanitization process.
     """
+    if sys.argv[1:2] == ['compact-store']:
+        args = setup_compact_argparse().parse_args(sys.argv[2:])
+        try:
+            compact_pseudonym_store(args.store)
+        except Exception as e:
+            logging.error(f"An error occurred: {e}")
+            sys.exit(1)
+        return
+    if sys.argv[1:2] == ['merge']:
+        args = setup_merge_argparse().parse_args(sys.argv[2:])
+        try:
+            merge_shards(args.shard_files, args.output_file)
+        except Exception as e:
+            logging.error(f"An error occurred: {e}")
+            sys.exit(1)
+        return
+
     parser = setup_argparse()
     args = parser.parse_args()
+    output_format = args.output_format
+    if args.input_format != 'auto':
+        output_format = output_format or args.input_format
+        if output_format != args.input_format and output_format not in CONVERSIONS[args.input_format]:
+            parser.error(f"cannot convert {args.input_format} input to {output_format} output")
+    # An existing file is processed on its own even if its name contains glob characters.
+    batch = not os.path.isfile(args.input_file) and (os.path.isdir(args.input_file)
+                                                     or bool(_GLOB_MAGIC.search(args.input_file)))
+    if args.incremental and not batch:
+        parser.error("--incremental requires a directory or glob input")
+    if args.checkpoint and (batch or args.workers > 1 or args.binary):
+        parser.error("--checkpoint applies to a single file and cannot be combined with --workers or --binary")
+    if args.shard and (batch or args.binary or args.checkpoint):
+        parser.error("--shard applies to a single file and cannot be combined with --binary or --checkpoint")
+    if args.shard and args.use_faker and not args.deterministic_pseudonyms:
+        logging.warning("Shards generate pseudonyms independently; use --deterministic_pseudonyms "
+                        "for values that are consistent across shards.")
+    if args.binary and (args.input_format not in ('text', 'auto') or output_format not in (None, 'text')
+                        or (args.workers > 1 and not batch)):
+        parser.error("--binary only applies to text input and output and cannot be combined with --workers")
 
     try:
-        patterns, replacements = load_patterns_from_json(args.patterns_file)
-        replacer = DataPatternReplacer(patterns, replacements, args.use_faker, args.faker_locale)
-
-        if args.input_format == 'text':
-            try:
-                with open(args.input_file, 'r') as infile, open(args.output_file, 'w') as outfile:
-                    for line in infile:
-                        sanitized_line = replacer.replace_patterns(line)
-                        outfile.write(sanitized_line)
-            except FileNotFoundError:
-                logging.error(f"Input file not found: {args.input_file}")
-                sys.exit(1)
-            except Exception as e:
-                logging.error(f"Error processing text file: {e}")
-                sys.exit(1)
-
-        elif args.input_format == 'csv':
-            process_csv_file(args.input_file, args.output_file, replacer)
+        patterns, replacements = load_patterns_from_json(args.patterns_file, args.analyze_patterns,
+                                                         args.strict_patterns)
+        column_rules = load_csv_column_rules(args.patterns_file)
+        path_rules = load_json_path_rules(args.patterns_file)
+        options = replacer_options(args)
+        replacer = DataPatternReplacer(patterns, replacements, **options)
 
-        elif args.input_format == 'json':
-            process_json_file(args.input_file, args.output_file, replacer)
-        else:
-            logging.error(f"Invalid input format: {args.input_format}")
-            sys.exit(1)
+        try:
+            if batch:
+                results = process_batch(args.input_file, args.output_file, replacer, args, column_rules, path_rules,
+                                        (patterns, replacements, options))
+            else:
+                input_format = infer_format(args.input_file) if args.input_format == 'auto' else args.input_format
+                process_file(args.input_file, args.output_file, replacer, input_format,
+                             output_format or input_format, args, column_rules, path_rules,
+                             (patterns, replacements, options))
+        finally:
+            replacer.close()
 
+        replacer.log_stats()
+        if batch:
+            failed = sum(result['status'] == 'error' for result in results)
+            if failed:
+                logging.error(f"{failed} of {len(results)} files failed.")
+                sys.exit(1)
         logging.info(f"Data sanitization complete. Sanitized data written to: {args.output_file}")
 
     except Exception as e: